@@ -16,17 +16,33 @@ Free numbers provide a convenient way to form and solve linear systems.
 >>> n3.refine().value
 (1-2j)
 
+FreeRational's are solved exactly:
+>>> n4 = FreeRational()
+>>> n5 = FreeRational()
+>>> solve(n4 + n5 / 3, 1)
+>>> solve(n4 - n5, 2)
+>>> n4.value, n5.value
+(Fraction(5, 4), Fraction(-3, 4))
+
 """
 
 from collections import OrderedDict
+from fractions import Fraction
 from functools import total_ordering
-from numbers import Real, Complex
+from numbers import Real, Complex, Rational
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
 
-__all__ = ['FreeComplex', 'FreeFloat', 'solve']
+__all__ = [
+    'FreeComplex', 'FreeFloat', 'FreeRational', 'solve', 'Batch', 'System',
+    'current_system', 'SumBuilder', 'linear_combination', 'SolverStats' ]
 
 import logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 class UndefinedError(ValueError):
     pass
@@ -66,6 +82,9 @@ class FreeComplex:
             if not other.defined:
                 return other * self.value
             other = other.value
+        if isinstance(other, Rational):
+            # Kept exact for FreeRational's
+            pass
         elif isinstance(other, Real):
             other = float(other)
         elif isinstance(other, Complex):
@@ -75,6 +94,8 @@ class FreeComplex:
     __rmul__ = __mul__
 
     def __truediv__(self, other):
+        if isinstance(other, Rational):
+            return self * Fraction(1, other)
         return self * (1.0 / other)
 
     def __rtruediv__(self, other):
@@ -87,6 +108,8 @@ class FreeComplex:
         return self
 
 class FreeFloat(FreeComplex):
+    # _value is None, the value, or a lazy System with equations of self
+    # that are not solved yet
     __slots__ = ['_value']
 
     def __init__(self):
@@ -94,20 +117,30 @@ class FreeFloat(FreeComplex):
 
     @property
     def value(self):
-        if self._value is None:
+        value = self._value
+        if isinstance(value, System):
+            value._resolve(self)
+            value = self._value
+            if isinstance(value, System):
+                value = None
+        if value is None:
             raise UndefinedError
-        return self._value
+        return value
 
     @property
     def defined(self):
-        return self._value is not None
+        value = self._value
+        if isinstance(value, System):
+            value._resolve(self)
+            value = self._value
+            return value is not None and not isinstance(value, System)
+        return value is not None
 
     def define(self, value):
-        if self._value is not None:
+        if self._value is not None and not isinstance(self._value, System):
             raise OverdefinedError
         if not isinstance(value, Real):
             raise TypeError(value)
-        logger.info('defined something')
         self._value = float(value)
 
     @property
@@ -118,18 +151,45 @@ class FreeFloat(FreeComplex):
     def imag(self):
         return 0.0
 
+class FreeRational(FreeFloat):
+    """
+    Free number with an exact Fraction value.
+
+    Sums of FreeRational's keep their weights as Fraction's (floats are
+    taken for their exact binary values), and equations of them are
+    solved by fraction-free integer elimination.  They can't be mixed
+    with FreeFloat's in one sum.
+
+    >>> x = FreeRational(); y = FreeRational()
+    >>> solve(x * 3 + y * 7, 1)
+    >>> solve(x * 2 - y, Fraction(1, 3))
+    >>> x.value, y.value
+    (Fraction(10, 51), Fraction(1, 17))
+    >>> (x + y / 3).value
+    Fraction(11, 51)
+    """
+    __slots__ = []
+
+    def define(self, value):
+        if self._value is not None and not isinstance(self._value, System):
+            raise OverdefinedError
+        if not isinstance(value, Real):
+            raise TypeError(value)
+        self._value = Fraction(value)
+
 class SumComplex(FreeComplex):
-    __slots__ = ['nums', 'weights', 'absolute']
+    __slots__ = ['nums', 'weights', 'absolute', '_weight_of']
 
-    def __new__(cls, *, nums=(), weights=(), absolute=0.0):
+    def __new__(cls, *, nums=(), weights=(), absolute=0):
         self = super().__new__(cls)
         self.nums = []
         self.weights = []
-        self.absolute = 0.0
+        self.absolute = 0
+        self._weight_of = None
         return self
 
-    def __init__(self, *, nums=(), weights=(), absolute=0.0):
-        if (nums, weights, absolute) == ((), (), 0.0):
+    def __init__(self, *, nums=(), weights=(), absolute=0):
+        if (nums, weights, absolute) == ((), (), 0):
             return
         self.nums.extend(nums)
         self.weights.extend(weights)
@@ -140,9 +200,23 @@ class SumComplex(FreeComplex):
     def normalize_nums_weights(cls, nums, weights, absolute):
         the_nums = {}
         the_weights = {}
+        # Rational constants are summed exactly, so that sums of defined
+        # FreeRational's stay exact
+        constant = 0
+        inexact = (
+            type(absolute) is not int and not isinstance(absolute, Rational) )
         for num, weight in cls.flatten_nums_weights(nums, weights):
-            if isinstance(num, (float, complex)):
-                absolute += num * weight
+            if not isinstance(num, FreeComplex):
+                if type(num) is float or type(weight) is float:
+                    absolute += num * weight
+                    inexact = True
+                elif (
+                    isinstance(num, Rational) and isinstance(weight, Rational)
+                ):
+                    constant += num * weight
+                else:
+                    absolute += num * weight
+                    inexact = True
                 continue;
             assert not isinstance(num, SumComplex)
             assert isinstance(num, FreeFloat)
@@ -153,14 +227,32 @@ class SumComplex(FreeComplex):
             else:
                 the_weights[num_id] += weight
 
+        # Weights of FreeRational's are Fractions, others floats or complex
+        exact = None
         nums = []; weights = [];
         for num_id in the_nums:
             num = the_nums[num_id]
             weight = the_weights[num_id]
             if not weight:
                 continue;
+            if exact is None:
+                exact = isinstance(num, FreeRational)
+            elif isinstance(num, FreeRational) is not exact:
+                raise TypeError("Can't mix FreeRational's with FreeFloat's")
+            if exact:
+                weight = Fraction(weight)
+            elif type(weight) is not float and type(weight) is not complex:
+                weight = float(weight)
             nums.append(num)
             weights.append(weight)
+
+        if exact is None:
+            exact = not inexact
+        if exact:
+            return nums, weights, Fraction(absolute) + constant
+        absolute += constant
+        if type(absolute) is not float and isinstance(absolute, Rational):
+            absolute = float(absolute)
         return nums, weights, absolute
 
     @classmethod
@@ -170,7 +262,13 @@ class SumComplex(FreeComplex):
             raise ValueError
 
         for num, weight in zip(nums, weights):
-            if isinstance(weight, Real):
+            if type(weight) is float or type(weight) is int:
+                pass
+            elif isinstance(weight, Rational):
+                # Kept exact for FreeRational's; converted to float in
+                # normalize_nums_weights() otherwise
+                pass
+            elif isinstance(weight, Real):
                 weight = float(weight)
             elif isinstance(weight, Complex):
                 weight = complex(weight)
@@ -178,37 +276,45 @@ class SumComplex(FreeComplex):
                 raise TypeError(weight)
             if weight == 0:
                 continue
-            if isinstance(num, Real):
-                yield float(num), weight
-                continue;
-            elif isinstance(num, Complex):
-                yield complex(num), weight
-                continue;
 
-            if not isinstance(num, FreeComplex):
-                raise TypeError(num)
-            if num.defined:
-                yield num.value, weight
-                continue;
+            if isinstance(num, FreeComplex):
+                if isinstance(num, SumComplex):
+                    for subnum, subweight in num:
+                        yield subnum, subweight * weight
+                    continue;
 
-            if isinstance(num, SumComplex):
-                for subnum, subweight in num:
-                    yield subnum, subweight * weight
+                # Not num.defined, which would solve equations queued in
+                # a lazy System
+                value = num._value
+                if value is None or isinstance(value, System):
+                    yield num, weight
+                else:
+                    yield value, weight
                 continue;
 
-            yield num, weight
+            if type(num) is float or isinstance(num, Rational):
+                yield num, weight
+            elif isinstance(num, Real):
+                yield float(num), weight
+            elif isinstance(num, Complex):
+                yield complex(num), weight
+            else:
+                raise TypeError(num)
 
     def __iter__(self):
         yield from self.flatten_nums_weights(self.nums, self.weights)
-        yield self.absolute, 1.0
+        yield self.absolute, 1
 
     def refine(self):
         self.nums, self.weights, self.absolute = self.normalize_nums_weights(
             self.nums, self.weights, self.absolute)
+        self._weight_of = None
         return self
 
     @property
     def defined(self):
+        if self.nums:
+            self._resolve()
         return not self.nums
 
     def define(self, value):
@@ -217,9 +323,24 @@ class SumComplex(FreeComplex):
     @property
     def value(self):
         if self.nums:
-            raise UndefinedError
+            self._resolve()
+            if self.nums:
+                raise UndefinedError
         return self.absolute
 
+    def _resolve(self):
+        """
+        Solve equations of nums queued in lazy systems, and refine.
+        """
+        queued = False
+        for num in self.nums:
+            system = num._value
+            if isinstance(system, System):
+                system._resolve(num)
+                queued = True
+        if queued:
+            self.refine()
+
     @property
     def real(self):
         return type(self)(
@@ -235,12 +356,10 @@ class SumComplex(FreeComplex):
             absolute=self.absolute.imag)
 
     def get_weight(self, num):
-        nums = self.nums
-        try:
-            index = nums.index(num)
-        except ValueError:
-            return 0.0
-        return self.weights[index]
+        weight_of = self._weight_of
+        if weight_of is None:
+            weight_of = self._weight_of = dict(zip(self.nums, self.weights))
+        return weight_of.get(num, 0.0)
 
     def __repr__(self):
         return (
@@ -250,12 +369,146 @@ class SumComplex(FreeComplex):
                 '\tabsolute={self.absolute} )'
             .format(self=self) )
 
-class Equation:
-    __slots__ = ['zero']
+class SumBuilder:
+    """
+    Mutable accumulator of a linear combination of free numbers.
+
+    Adding to a SumComplex creates a new one and normalizes everything
+    accumulated so far, so a long sum() is quadratic; SumBuilder keeps one
+    flat table of weights and creates a SumComplex once.
+
+    >>> x = [FreeFloat() for i in range(3)]
+    >>> builder = SumBuilder()
+    >>> for i, num in enumerate(x):
+    ...     builder += (i + 1) * num
+    >>> builder -= x[2]
+    >>> builder = builder.add(x[2], 0.5).add(4)
+    >>> total = builder.sum()
+    >>> total.weights, total.absolute
+    ([1.0, 2.0, 2.5], 4.0)
+    >>> solve(total); solve(x[1], 1); solve(x[2], 2)
+    >>> x[0].value
+    -11.0
+    """
+    __slots__ = ['_nums', '_weights', 'absolute', '_constant']
+
+    def __init__(self):
+        self._nums = {}
+        self._weights = {}
+        self.absolute = 0
+        # Exact sum of rational constants, see normalize_nums_weights()
+        self._constant = 0
+
+    def add(self, num, weight=1):
+        """
+        Add num * weight and return self.
+        """
+        if (
+            type(num) is FreeFloat and num._value is None and
+            isinstance(weight, Real)
+        ):
+            # Shortcut for the most common case
+            terms = ((num, float(weight)),) if weight else ()
+        else:
+            terms = SumComplex.flatten_nums_weights((num,), (weight,))
+        nums = self._nums; weights = self._weights
+        for num, weight in terms:
+            if not isinstance(num, FreeComplex):
+                if isinstance(num, Rational) and isinstance(weight, Rational):
+                    self._constant += num * weight
+                else:
+                    self.absolute += num * weight
+                continue
+            num_id = id(num)
+            if num_id in weights:
+                weights[num_id] += weight
+            else:
+                nums[num_id] = num
+                weights[num_id] = weight
+        return self
+
+    def __iadd__(self, other):
+        return self.add(other)
+
+    def __isub__(self, other):
+        return self.add(other, -1)
+
+    def sum(self):
+        """
+        Return SumComplex of everything added so far.
+        """
+        result = SumComplex()
+        weights = self._weights
+        for num_id, num in self._nums.items():
+            weight = weights[num_id]
+            if not weight:
+                continue
+            result.nums.append(num)
+            result.weights.append(weight)
+        absolute = self.absolute
+        if result.nums:
+            exact = isinstance(result.nums[0], FreeRational)
+        else:
+            exact = isinstance(absolute, Rational)
+        if exact:
+            result.absolute = Fraction(absolute) + self._constant
+            # Make weights Fractions (or raise TypeError if mixed)
+            return result.refine()
+        absolute += self._constant
+        if isinstance(absolute, Rational):
+            absolute = float(absolute)
+        result.absolute = absolute
+        return result
 
-    zeros = []
+def linear_combination(nums, weights, constant=0):
+    """
+    Return SumComplex of sum(num * weight) + constant.
+
+    Equivalent to the sum() of products, but takes linear time.
+
+    >>> x = [FreeFloat() for i in range(1000)]
+    >>> total = linear_combination(x, range(1000), 1)
+    >>> len(total.nums), total.get_weight(x[10]), total.absolute
+    (999, 10.0, 1.0)
+    """
+    nums = list(nums); weights = list(weights)
+    if len(nums) != len(weights):
+        raise ValueError
+    builder = SumBuilder()
+    for num, weight in zip(nums, weights):
+        builder.add(num, weight)
+    builder.add(constant)
+    return builder.sum()
+
+class _Row:
+    """
+    Sparse row of the eliminated system:
+    pivot + sum(weight * num for num, weight in weights.items()) + absolute
+    equals zero.
+    """
+    __slots__ = ['pivot', 'weights', 'absolute']
+
+    def __init__(self, pivot, weights, absolute):
+        self.pivot = pivot
+        self.weights = weights
+        self.absolute = absolute
+
+class _ExactRow:
+    """
+    Row of the eliminated system of FreeRational's, with int weights:
+    level * pivot + sum(weight * num for num, weight in weights.items())
+    + absolute equals zero.
+    """
+    __slots__ = ['pivot', 'level', 'weights', 'absolute']
 
-    _defined_counter = 0
+    def __init__(self, pivot, level, weights, absolute):
+        self.pivot = pivot
+        self.level = level
+        self.weights = weights
+        self.absolute = absolute
+
+class Equation:
+    __slots__ = ['zero']
 
     def __init__(self, lhs, rhs=0):
         self.zero = zero = lhs - rhs
@@ -268,84 +521,795 @@ class Equation:
         """
         return self.zero.defined and self.zero.value == 0.0
 
-    def solve(self):
-        self.add_zero(self.zero)
+    def solve(self, system=None):
+        if system is None:
+            system = current_system()
+        system.add_zero(self.zero)
 
-    @classmethod
-    def add_zero(cls, zero):
+# Pivot weight must be at least this fraction of the largest weight
+# in its row
+_PIVOT_THRESHOLD = 0.1
+
+class System:
+    """
+    Store of equations solved so far.
+
+    Systems are independent; each one serializes its own operations with
+    a lock, so different systems can be used from different threads
+    at once.  Module-level solve() uses the current system, which is the
+    innermost one entered with 'with' in this thread or asyncio task, or
+    the default system.
+
+    >>> x = FreeFloat(); y = FreeFloat()
+    >>> system = System()
+    >>> system.solve(x + y, 3)
+    >>> with system:
+    ...     solve(x - y, 1)
+    >>> x.value, y.value
+    (2.0, 1.0)
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> def task(k):
+    ...     x = FreeFloat(); y = FreeFloat()
+    ...     with System():
+    ...         solve(x + y, k)
+    ...         solve(x - y, 1)
+    ...     return x.value
+    >>> with ThreadPoolExecutor(4) as executor:
+    ...     list(executor.map(task, range(4)))
+    [0.5, 1.0, 1.5, 2.0]
+
+    A lazy system only queues equations.  Reading value or defined of
+    a num solves queued equations of its connected component, all at
+    once, in minimum degree order.
+    >>> x = [FreeFloat() for i in range(1000)]
+    >>> y = FreeFloat(); z = FreeFloat()
+    >>> system = System(lazy=True)
+    >>> for i in range(999):
+    ...     system.solve(x[i] - x[i + 1], 1)
+    >>> system.solve(x[999], 0)
+    >>> system.solve(y + z, 1); system.solve(y - z, 3)
+    >>> x[500].value
+    499.0
+    >>> system
+    <System with 0 rows and 2 queued equations>
+    >>> z.value
+    -1.0
+    """
+
+    def __init__(self, stats=None, lazy=False):
+        # Rows in reduced echelon form, by pivot.  No row contains a pivot
+        # of another row, and all nums in rows are undefined.
+        self.rows = {}
+        # Rows (by pivot) containing a num, for each non-pivot num
+        self.index = {}
+        # SolverStats, or None to collect nothing
+        self.stats = stats
+        # Common denominator of exact rows (see _add_exact_row())
+        self._level = 1
+        # Queued equations of a lazy system as [weights, absolute] by key,
+        # and keys of those containing a num, for each num
+        self.lazy = lazy
+        self._queued = {}
+        self._queued_index = {}
+        self._keys = itertools.count()
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return '<{} with {} rows and {} queued equations>'.format(
+            type(self).__name__, len(self.rows), len(self._queued) )
+
+    def __enter__(self):
+        _systems.set(_systems.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _systems.set(_systems.get()[:-1])
+
+    def solve(self, lhs, rhs=0):
+        Equation(lhs, rhs).solve(self)
+
+    def add_zero(self, zero):
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
         zero, imag = zero.real, zero.imag
-        if cls.trivial_add(zero):
-            return
-        zero = cls.substitute(zero)
-        if cls.trivial_add(zero):
-            return
-        zero /= zero.weights[0]
-        cls.zeros.append(zero)
-        cls.back_substitute()
-        if imag:
-            cls.add_zero(imag)
+        zero.refine()
+        if stats is not None:
+            stats.refines += 1
+            stats.timings['refine'] += time.perf_counter() - start
+        with self._lock:
+            if zero.nums and isinstance(zero.nums[0], FreeRational):
+                self._add_exact_row(
+                    dict(zip(zero.nums, zero.weights)), zero.absolute )
+            elif self.lazy and zero.nums:
+                self._queue(
+                    dict(zip(zero.nums, zero.weights)), zero.absolute )
+            else:
+                self._add_row(
+                    dict(zip(zero.nums, zero.weights)), zero.absolute )
+            if stats is not None:
+                stats.equations += 1
+                stats.rows = len(self.rows)
+                if stats.callback is not None:
+                    stats.callback(stats.snapshot())
+        # Not bool(imag), which would solve queued equations
+        if imag.nums or imag.absolute:
+            self.add_zero(imag)
 
-    @classmethod
-    def trivial_add(cls, zero):
-        if zero.defined:
-            if zero.value:
+    def _add_row(self, weights, absolute):
+        rows = self.rows
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        # Substitute pivots.  Rows do not contain pivots, so nums added
+        # here need no substitution themselves.
+        substituted = [num for num in weights if num in rows]
+        for num in substituted:
+            weight = weights.pop(num)
+            row = rows[num]
+            for subnum, subweight in row.weights.items():
+                new_weight = weights.get(subnum, 0.0) - weight * subweight
+                if new_weight:
+                    weights[subnum] = new_weight
+                elif subnum in weights:
+                    del weights[subnum]
+            absolute -= weight * row.absolute
+        if stats is not None:
+            stats.substitutions += len(substituted)
+            stats.timings['substitute'] += time.perf_counter() - start
+
+        if not weights:
+            if absolute:
                 raise OverdefinedError("Inconsistent equation")
             else:
                 raise OverdefinedError("Redundant equation")
-        if len(zero.nums) == 1:
-            num, = zero.nums
-            weight, = zero.weights
-            num.define(- zero.absolute / weight)
-            zero.refine()
-            cls.refine()
-            return True
-        return False
+        # Threshold Markowitz pivoting: of nums with weights not much
+        # smaller than the largest one, take the one in the fewest rows,
+        # so that back substitution touches as few rows as possible
+        index = self.index
+        threshold = _PIVOT_THRESHOLD * max(map(abs, weights.values()))
+        pivot = min(
+            (num for num, weight in weights.items()
+                if abs(weight) >= threshold),
+            key=lambda num: len(index.get(num, ())) )
+        factor = 1.0 / weights.pop(pivot)
+        weights = {
+            num: weight * factor for num, weight in weights.items()
+            if weight * factor }
+        if not weights:
+            self._define(pivot, - absolute * factor)
+            return
+        row = _Row(pivot, weights, absolute * factor)
 
-    @classmethod
-    def substitute(cls, zero):
-        zero.refine()
-        for z in cls.zeros:
-            num, *nums = z.nums
-            weight = zero.get_weight(num)
-            if not weight:
+        # Back substitute into rows containing the new pivot
+        if stats is not None:
+            start = time.perf_counter()
+            max_length = len(weights)
+        fill_in = 0
+        definitions = []
+        others = index.pop(pivot, ())
+        for other in others:
+            other = rows[other]
+            weight = other.weights.pop(pivot)
+            for num, subweight in weights.items():
+                new_weight = other.weights.get(num, 0.0) - weight * subweight
+                if new_weight:
+                    if num not in other.weights:
+                        index.setdefault(num, set()).add(other.pivot)
+                        fill_in += 1
+                    other.weights[num] = new_weight
+                elif num in other.weights:
+                    del other.weights[num]
+                    index[num].discard(other.pivot)
+            other.absolute -= weight * row.absolute
+            if not other.weights:
+                definitions.append(other)
+            elif stats is not None:
+                max_length = max(max_length, len(other.weights))
+        for num in weights:
+            index.setdefault(num, set()).add(pivot)
+        rows[pivot] = row
+        if stats is not None:
+            stats.back_substitutions += len(others)
+            stats.fill_in += fill_in
+            stats.max_fill_in = max(stats.max_fill_in, fill_in)
+            # Lengths count the pivot
+            stats.max_row_length = max(stats.max_row_length, max_length + 1)
+            stats.timings['back_substitute'] += time.perf_counter() - start
+        for other in definitions:
+            del rows[other.pivot]
+            self._define(other.pivot, - other.absolute)
+
+    def solve_queued(self):
+        """
+        Solve all equations queued in a lazy system.
+        """
+        with self._lock:
+            while self._queued:
+                weights, absolute = next(iter(self._queued.values()))
+                self._resolve(next(iter(weights)))
+
+    def _queue(self, weights, absolute):
+        key = next(self._keys)
+        self._queued[key] = [weights, absolute]
+        queued_index = self._queued_index
+        for num in weights:
+            queued_index.setdefault(num, set()).add(key)
+            if num._value is None:
+                num._value = self
+
+    def _resolve(self, num):
+        """
+        Solve queued equations of the connected component of num, along
+        with rows of the component.
+        """
+        with self._lock:
+            queued = self._queued; queued_index = self._queued_index
+            rows = self.rows; index = self.index
+            if not queued:
+                return
+            keys = set(); pivots = set()
+            seen = {num}; stack = [num]
+            while stack:
+                num = stack.pop()
+                nums = []
+                for key in queued_index.get(num, ()):
+                    if key not in keys:
+                        keys.add(key)
+                        nums.extend(queued[key][0])
+                row_pivots = list(index.get(num, ()))
+                if num in rows:
+                    row_pivots.append(num)
+                for pivot in row_pivots:
+                    if pivot not in pivots:
+                        pivots.add(pivot)
+                        nums.append(pivot)
+                        nums.extend(rows[pivot].weights)
+                for num in nums:
+                    if num not in seen:
+                        seen.add(num)
+                        stack.append(num)
+            if not keys:
+                return
+
+            equations = []
+            for key in keys:
+                weights, absolute = queued.pop(key)
+                for num in weights:
+                    others = queued_index[num]
+                    others.discard(key)
+                    if not others:
+                        del queued_index[num]
+                equations.append((weights, absolute))
+            for pivot in pivots:
+                row = rows.pop(pivot)
+                for num in row.weights:
+                    others = index[num]
+                    others.discard(pivot)
+                    if not others:
+                        del index[num]
+                weights = dict(row.weights)
+                weights[pivot] = 1.0
+                equations.append((weights, row.absolute))
+            self._solve_component(equations)
+
+    def _solve_component(self, equations):
+        """
+        Solve equations by sparse elimination, define nums that are
+        determined, and add equations of the others as rows.
+
+        The next pivot is the num in the fewest remaining equations
+        (minimum degree), and its row the shortest one with a weight
+        within _PIVOT_THRESHOLD of the largest weight in it.
+        """
+        errors = []
+        # Remaining equations by number, and their numbers for each num
+        remaining = {}
+        columns = {}
+        for number, (weights, absolute) in enumerate(equations):
+            # Nums may have been defined since the equation was queued
+            for num in list(weights):
+                value = num._value
+                if value is not None and not isinstance(value, System):
+                    absolute += weights.pop(num) * value
+            if not weights:
+                errors.append(OverdefinedError(
+                    "Inconsistent equation" if absolute else
+                    "Redundant equation" ))
                 continue
-            zero -= weight * z
-        return zero
+            remaining[number] = [weights, absolute]
+            for num in weights:
+                columns.setdefault(num, set()).add(number)
+        counter = itertools.count()
+        heap = [
+            (len(numbers), next(counter), num)
+            for num, numbers in columns.items() ]
+        heapq.heapify(heap)
 
-    @classmethod
-    def back_substitute(cls):
-        zeros = []
-        trivial_zeros = []
-        zero = cls.zeros[-1]
-        num, *nums = zero.nums
-
-        needs_refine = False
-        for z in cls.zeros[:-1]:
-            weight = z.get_weight(num)
-            if weight:
-                z = z - weight * zero
-            if len(z.nums) > 1:
-                zeros.append(z)
+        eliminated = []
+        while heap:
+            count, _, pivot = heapq.heappop(heap)
+            numbers = columns.get(pivot)
+            if numbers is None or len(numbers) != count:
+                # Outdated entry
+                continue
+            del columns[pivot]
+            if not numbers:
+                # Free num, left undefined
+                continue
+            # Shortest row within threshold, or failing that, the one
+            # where the weight is relatively largest
+            best = None; best_ratio = 0.0
+            for number in numbers:
+                weights = remaining[number][0]
+                ratio = abs(weights[pivot]) / max(map(abs, weights.values()))
+                if ratio >= _PIVOT_THRESHOLD:
+                    if (
+                        best_ratio < _PIVOT_THRESHOLD or
+                        len(weights) < len(best_weights)
+                    ):
+                        best = number; best_ratio = ratio
+                        best_weights = weights
+                elif ratio > best_ratio:
+                    best = number; best_ratio = ratio
+                    best_weights = weights
+            weights, absolute = remaining.pop(best)
+            factor = 1.0 / weights.pop(pivot)
+            weights = {
+                num: weight * factor for num, weight in weights.items()
+                if weight * factor }
+            absolute *= factor
+            for num in weights:
+                columns[num].discard(best)
+            for number in numbers:
+                if number == best:
+                    continue
+                other = remaining[number]
+                other_weights = other[0]
+                weight = other_weights.pop(pivot)
+                for num, subweight in weights.items():
+                    new_weight = (
+                        other_weights.get(num, 0.0) - weight * subweight )
+                    if new_weight:
+                        if num not in other_weights:
+                            columns[num].add(number)
+                        other_weights[num] = new_weight
+                    elif num in other_weights:
+                        del other_weights[num]
+                        columns[num].discard(number)
+                other[1] -= weight * absolute
+                if not other_weights:
+                    del remaining[number]
+                    errors.append(OverdefinedError(
+                        "Inconsistent equation" if other[1] else
+                        "Redundant equation" ))
+            for num in weights:
+                heapq.heappush(heap, (len(columns[num]), next(counter), num))
+            eliminated.append((pivot, weights, absolute))
+
+        # Back substitution; nums of eliminated equations are pivots of
+        # later ones, or free
+        values = {}
+        undetermined = []
+        for pivot, weights, absolute in reversed(eliminated):
+            value = - absolute
+            for num, weight in weights.items():
+                if num not in values:
+                    undetermined.append((pivot, weights, absolute))
+                    break
+                value -= weight * values[num]
             else:
-                trivial_zeros.append(z)
-        zeros.append(zero)
-        cls.zeros = zeros
-        for z in trivial_zeros:
-            if not cls.trivial_add(z):
-                raise AssertionError
+                values[pivot] = value
+        for num, value in values.items():
+            self._define(num, value)
+        for pivot, weights, absolute in undetermined:
+            weights = dict(weights)
+            for num in list(weights):
+                if num in values:
+                    absolute += weights.pop(num) * values[num]
+            weights[pivot] = 1.0
+            self._add_row(weights, absolute)
+        if errors:
+            raise errors[0]
 
-    @classmethod
-    def refine(cls):
-        zeros = cls.zeros
-        if not zeros:
+    def _define(self, num, value):
+        """
+        Define num and eliminate it from all rows, defining pivots
+        of rows that are left with no other nums.
+        """
+        rows = self.rows; index = self.index
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        pending = [(num, value)]
+        while pending:
+            num, value = pending.pop()
+            num.define(value)
+            if stats is not None:
+                stats.definitions += 1
+            for pivot in index.pop(num, ()):
+                row = rows[pivot]
+                row.absolute += row.weights.pop(num) * value
+                if not row.weights:
+                    del rows[pivot]
+                    pending.append((pivot, - row.absolute))
+        if stats is not None:
+            stats.timings['define'] += time.perf_counter() - start
+
+    def _add_exact_row(self, weights, absolute):
+        """
+        Add row of Fraction weights, by fraction-free (Bareiss) elimination.
+
+        Scaled by the common level D, which is the determinant of the
+        system eliminated so far, every row of the reduced echelon form is
+        integral; a row is stored at the level of its last update, and
+        brought to the current one by exact division.  So are rows updated
+        with a new pivot, and their numbers never grow beyond those of
+        determinants; no gcd is computed except when clearing denominators
+        of a new equation.
+        """
+        rows = self.rows; index = self.index
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        if not weights:
+            if absolute:
+                raise OverdefinedError("Inconsistent equation")
+            else:
+                raise OverdefinedError("Redundant equation")
+        denominator = math.lcm(
+            absolute.denominator,
+            *(weight.denominator for weight in weights.values()) )
+        weights = {
+            num: weight.numerator * (denominator // weight.denominator)
+            for num, weight in weights.items() }
+        absolute = absolute.numerator * (denominator // absolute.denominator)
+        content = math.gcd(absolute, *weights.values())
+        if content != 1:
+            weights = {
+                num: weight // content for num, weight in weights.items() }
+            absolute //= content
+
+        # Substitute pivots into the row scaled by level.  Rows do not
+        # contain pivots, so nums added here need no substitution.
+        level = self._level
+        substituted = [
+            (num, weights.pop(num)) for num in list(weights) if num in rows ]
+        if level != 1:
+            weights = {num: weight * level for num, weight in weights.items()}
+            absolute *= level
+        for num, weight in substituted:
+            row = rows[num]
+            if row.level == level:
+                scale = None
+            else:
+                # Division is exact, see above
+                scale = level
+                weight = weight * level
+            for subnum, subweight in row.weights.items():
+                subweight *= weight
+                if scale is not None:
+                    subweight //= row.level
+                new_weight = weights.get(subnum, 0) - subweight
+                if new_weight:
+                    weights[subnum] = new_weight
+                elif subnum in weights:
+                    del weights[subnum]
+            if scale is None:
+                absolute -= weight * row.absolute
+            else:
+                absolute -= weight * row.absolute // row.level
+        if stats is not None:
+            stats.substitutions += len(substituted)
+            stats.timings['substitute'] += time.perf_counter() - start
+
+        if not weights:
+            if absolute:
+                raise OverdefinedError("Inconsistent equation")
+            else:
+                raise OverdefinedError("Redundant equation")
+        # Pivot in the fewest rows; no threshold, as nothing is rounded
+        pivot = min(weights, key=lambda num: len(index.get(num, ())))
+        new_level = weights.pop(pivot)
+
+        # Back substitute into rows containing the new pivot:
+        # other = (new_level * other - weight * row) / other.level
+        if stats is not None:
+            start = time.perf_counter()
+            max_length = len(weights)
+        fill_in = 0
+        definitions = []
+        others = index.pop(pivot, ())
+        get = weights.get
+        for other in others:
+            other = rows[other]
+            old_weights = other.weights
+            weight = old_weights.pop(pivot)
+            level = other.level
+            other.weights = other_weights = {
+                num: (new_level * old_weight - weight * get(num, 0)) // level
+                for num, old_weight in old_weights.items() }
+            for num, subweight in weights.items():
+                if num not in old_weights:
+                    other_weights[num] = - weight * subweight // level
+                    index.setdefault(num, set()).add(other.pivot)
+                    fill_in += 1
+                elif not other_weights[num]:
+                    del other_weights[num]
+                    index[num].discard(other.pivot)
+            other.absolute = (
+                new_level * other.absolute - weight * absolute ) // level
+            other.level = new_level
+            if not other_weights:
+                definitions.append(other)
+            elif stats is not None:
+                max_length = max(max_length, len(other_weights))
+        if weights:
+            for num in weights:
+                index.setdefault(num, set()).add(pivot)
+            rows[pivot] = _ExactRow(pivot, new_level, weights, absolute)
+        else:
+            definitions.append(_ExactRow(pivot, new_level, weights, absolute))
+        for other in definitions:
+            rows.pop(other.pivot, None)
+            other.pivot.define(Fraction(- other.absolute, other.level))
+        # A system with no rows left starts over at level 1
+        self._level = new_level if rows else 1
+        if stats is not None:
+            stats.back_substitutions += len(others)
+            stats.fill_in += fill_in
+            stats.max_fill_in = max(stats.max_fill_in, fill_in)
+            stats.definitions += len(definitions)
+            stats.max_row_length = max(stats.max_row_length, max_length + 1)
+            stats.timings['back_substitute'] += time.perf_counter() - start
+
+class SolverStats:
+    """
+    Statistics of a System, collected while it is system.stats.
+
+    equations counts equations added (real and imaginary parts separately),
+    rows is the number of stored zeros, substitutions counts pivots
+    substituted into new equations, back_substitutions counts stored rows
+    rewritten with a new pivot, and fill_in counts entries those rewrites
+    created (max_fill_in is the largest number for one equation).
+    timings maps phases to seconds.
+
+    >>> x = [FreeFloat() for i in range(4)]
+    >>> system = System(SolverStats())
+    >>> system.solve(x[0] + x[1] + x[2], 1)
+    >>> system.solve(x[1] - x[2] + x[3])
+    >>> system.solve(x[2] + x[3], 2)
+    >>> system.solve(x[3], 1)
+    >>> snapshot = system.stats.snapshot()
+    >>> del snapshot['timings']
+    >>> snapshot
+    {'equations': 4, 'rows': 0, 'refines': 4, 'substitutions': 2, \
+'back_substitutions': 2, 'definitions': 4, 'fill_in': 0, 'max_fill_in': 0, \
+'max_row_length': 3}
+
+    If callback is given, it is called with a snapshot after each
+    equation.
+    """
+
+    COUNTERS = (
+        'equations', 'rows', 'refines', 'substitutions',
+        'back_substitutions', 'definitions', 'fill_in', 'max_fill_in',
+        'max_row_length' )
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.timings = dict.fromkeys(
+            ('refine', 'substitute', 'back_substitute', 'define'), 0.0 )
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, ', '.join(
+            '{}={}'.format(name, getattr(self, name))
+            for name in self.COUNTERS ))
+
+    def snapshot(self):
+        """
+        Return dict of current values.
+        """
+        snapshot = {name: getattr(self, name) for name in self.COUNTERS}
+        snapshot['timings'] = dict(self.timings)
+        return snapshot
+
+class Batch:
+    """
+    Context in which solve() only records equations; on exit, all of them
+    are solved at once as a linear system with NumPy (LAPACK), and values
+    are defined.
+
+    >>> n1 = FreeFloat()
+    >>> n2 = FreeFloat()
+    >>> with Batch():
+    ...     solve(n1 + n2)
+    ...     solve(n1 - 2 * n2, 12)
+    >>> n1.value, n2.value
+    (4.0, -4.0)
+
+    As with one-by-one solving, a system with dependent equations is
+    overdefined; unlike it, nothing is defined unless the whole system
+    has a unique solution.
+    >>> n3 = FreeComplex()
+    >>> n4 = FreeFloat()
+    >>> with Batch():  # doctest: +IGNORE_EXCEPTION_DETAIL
+    ...     solve(n3 * (1-2j), -3-4j)
+    ...     solve(n4, n3.real)
+    ...     solve(n4 * 2, 2)
+    Traceback (most recent call last):
+        ...
+    freenum.OverdefinedError: Redundant equation
+    >>> with Batch():  # doctest: +IGNORE_EXCEPTION_DETAIL
+    ...     solve(n3 * (1-2j) + n4, -3-4j)
+    Traceback (most recent call last):
+        ...
+    freenum.UndefinedError: Underdefined system
+
+    With sparse=True, the coefficient matrix is a scipy.sparse matrix
+    solved by SuperLU; sparse=None (default) uses it for large systems if
+    SciPy is available.
+
+    Equations of FreeRational's are solved exactly on exit, one by one.
+    """
+
+    # Systems with at least this many unknowns are solved as sparse ones
+    # if SciPy is available and sparse=None
+    sparse_size = 1000
+
+    def __init__(self, sparse=None, system=None):
+        self.sparse = sparse
+        self.system = system
+        self.equations = []
+
+    def __enter__(self):
+        if self.system is None:
+            self.system = current_system()
+        _batches.set(_batches.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _batches.set(_batches.get()[:-1])
+        if exc_type is None:
+            self.solve()
+
+    def solve(self):
+        """
+        Solve recorded equations and forget them.
+        """
+        equations = self.equations
+        self.equations = []
+        if not equations:
             return
-        zeros = [zero.refine() for zero in zeros]
-        cls.zeros = []
-        for zero in zeros:
-            cls.add_zero(zero)
+        system = self.system
+        if system is None:
+            system = current_system()
+
+        columns = {}
+        entries = []; absolutes = []
+        for equation in equations:
+            zero = equation.zero
+            if zero.nums and isinstance(zero.nums[0], FreeRational):
+                # Solved exactly, not in floats
+                system.add_zero(zero)
+                continue
+            real, imag = zero.real, zero.imag
+            # Imaginary part is an equation only if it is not trivial,
+            # see System.add_zero()
+            for part in (
+                (real, imag) if imag.nums or imag.absolute else (real,)
+            ):
+                part.refine()
+                row = len(absolutes)
+                for num, weight in zip(part.nums, part.weights):
+                    column = columns.setdefault(num, len(columns))
+                    entries.append((row, column, weight))
+                absolutes.append(part.absolute)
+        if not absolutes:
+            return
+        import numpy
+        nums = list(columns)
+        shape = len(absolutes), len(nums)
+        rhs = - numpy.array(absolutes, dtype=float)
+
+        sparse = self.sparse
+        if sparse is None:
+            sparse = shape[1] >= self.sparse_size and _have_scipy()
+        values = None
+        if sparse and shape[0] == shape[1]:
+            values = _solve_sparse(numpy, entries, shape, rhs)
+        if values is None:
+            matrix = numpy.zeros(shape)
+            for row, column, weight in entries:
+                matrix[row, column] += weight
+            values = _solve_dense(numpy, matrix, rhs)
+
+        with system._lock:
+            for num, value in zip(nums, values.tolist()):
+                if not num.defined:
+                    system._define(num, value)
+
+# Stacks of entered systems and batches, for each thread and asyncio task
+_systems = contextvars.ContextVar('freenum_systems', default=())
+_batches = contextvars.ContextVar('freenum_batches', default=())
+
+_default_system = System()
+
+def current_system():
+    """
+    Return the system used by solve(): the innermost one entered in this
+    thread or asyncio task, or the default one.
+    """
+    systems = _systems.get()
+    if systems:
+        return systems[-1]
+    return _default_system
+
+def _have_scipy():
+    try:
+        import scipy.sparse
+    except ImportError:
+        return False
+    return True
+
+def _solve_sparse(numpy, entries, shape, rhs):
+    """
+    Return solution of a square system, or None if it is singular.
+    """
+    import scipy.sparse
+    import scipy.sparse.linalg
+    rows, columns, weights = zip(*entries) if entries else ((), (), ())
+    matrix = scipy.sparse.csc_matrix(
+        (weights, (rows, columns)), shape=shape )
+    try:
+        return scipy.sparse.linalg.splu(matrix).solve(rhs)
+    except RuntimeError:
+        # Singular, see _solve_dense() for which error to raise
+        return None
+
+def _solve_dense(numpy, matrix, rhs):
+    size = max(matrix.shape)
+    if matrix.shape[0] == matrix.shape[1]:
+        # Rounding errors make LU succeed on most singular matrices, so
+        # condition number is estimated from norms of inverse matrix
+        # applied to random vectors, solved along with rhs
+        probes = numpy.random.default_rng(0).standard_normal((size, 2))
+        try:
+            solution = numpy.linalg.solve(
+                matrix, numpy.column_stack((rhs, probes)) )
+        except numpy.linalg.LinAlgError:
+            pass
+        else:
+            inverse_norm = max(
+                numpy.linalg.norm(solution[:, k + 1]) /
+                numpy.linalg.norm(probes[:, k])
+                for k in range(probes.shape[1]) )
+            condition = numpy.linalg.norm(matrix) * inverse_norm
+            if condition * size * numpy.finfo(float).eps < 1:
+                return solution[:, 0]
+    values, residuals, rank, singular = numpy.linalg.lstsq(
+        matrix, rhs, rcond=None )
+    if rank < matrix.shape[0]:
+        scale = numpy.abs(matrix).sum() * numpy.abs(values).max(initial=0.0)
+        scale += numpy.abs(rhs).sum()
+        error = numpy.abs(matrix @ values - rhs).max(initial=0.0)
+        if error > 1e-9 * scale:
+            raise OverdefinedError("Inconsistent equation")
+        raise OverdefinedError("Redundant equation")
+    if rank < matrix.shape[1]:
+        raise UndefinedError("Underdefined system")
+    return values
 
 def solve(lhs, rhs=0):
-    Equation(lhs, rhs).solve()
+    equation = Equation(lhs, rhs)
+    batches = _batches.get()
+    if batches:
+        batches[-1].equations.append(equation)
+        return
+    equation.solve()
 
 if __name__ == '__main__':
     import doctest
@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+
+"""
+Benchmarks for freenum.py.
+
+Running this as a script builds and solves families of linear systems of
+growing size and prints the best time, the peak traced memory and the
+number of objects left allocated by each:
+
+chain
+    tridiagonal systems, equations in random order;
+grid
+    Laplace equation on a square grid with fixed boundary values,
+    equations row by row;
+random
+    random sparse systems with three unknowns per equation;
+dense
+    small systems with every unknown in every equation;
+complex
+    tridiagonal systems of FreeComplex unknowns and complex weights;
+rational
+    dense systems of FreeRational unknowns and small integer weights,
+    solved exactly.
+
+Each case builds its unknowns and expressions and solves them in a fresh
+System, so expression building (SumComplex, Equation) is timed along with
+elimination.  With --mode batch, equations are solved in a Batch instead,
+and with --mode lazy, in a lazy System (all of them, at the end).
+
+With --json, results are also written as JSON, so that runs before and
+after a change can be compared.
+"""
+
+import gc
+import json
+import platform
+import random
+import sys
+
+from freenum import (
+    FreeFloat, FreeComplex, FreeRational, System, Batch, solve,
+    linear_combination )
+from pcf_bench import best_time, peak_memory, format_params
+
+def allocated_objects(function, *args, setup=None, **kwargs):
+    """
+    Return number of memory blocks allocated by function and still
+    allocated while its result is alive (for the cases here: unknowns
+    with their values, and anything they keep).
+    """
+    if setup is not None:
+        setup()
+    gc.collect()
+    before = sys.getallocatedblocks()
+    result = function(*args, **kwargs)
+    gc.collect()
+    count = sys.getallocatedblocks() - before
+    del result
+    return count
+
+MODES = ('direct', 'batch', 'lazy')
+
+class Case:
+    """
+    A single benchmark: function(size, seed, mode) building and solving
+    a system of size unknowns.
+    """
+
+    def __init__(self, family, size, function, *, seed=0, mode='direct'):
+        self.family = family
+        self.size = size
+        self.function = function
+        self.seed = seed
+        self.mode = mode
+
+    @property
+    def params(self):
+        return {'size': self.size, 'mode': self.mode}
+
+    def run(self, repeat=3, memory=True):
+        args = self.size, self.seed, self.mode
+        result = {
+            'family': self.family,
+            'params': self.params,
+            'time': best_time(self.function, *args, repeat=repeat),
+            }
+        if memory:
+            result['peak_memory'] = peak_memory(self.function, *args)
+            result['objects'] = allocated_objects(self.function, *args)
+        return result
+
+def _solve_all(equations, mode):
+    """
+    Solve (lhs, rhs) pairs in a new System, as mode says.
+    """
+    with System(lazy=mode == 'lazy') as system:
+        if mode == 'batch':
+            with Batch():
+                for lhs, rhs in equations:
+                    solve(lhs, rhs)
+        else:
+            for lhs, rhs in equations:
+                solve(lhs, rhs)
+        system.solve_queued()
+
+def chain(size, seed, mode):
+    rng = random.Random(seed)
+    nums = [FreeFloat() for i in range(size)]
+    order = list(range(size))
+    rng.shuffle(order)
+    _solve_all((
+        (sum((4.0 if j == i else rng.uniform(-1, 1)) * nums[j]
+            for j in range(max(i - 1, 0), min(i + 2, size)) ),
+            rng.uniform(-1, 1) )
+        for i in order ), mode)
+    return nums
+
+def grid(size, seed, mode):
+    """
+    Grid of about size interior points.
+    """
+    rng = random.Random(seed)
+    side = max(int(size ** 0.5), 1)
+    # Boundary points are numbers, interior ones unknowns
+    points = [
+        [rng.uniform(-1, 1) for j in range(side + 2)]
+        for i in range(side + 2) ]
+    for i in range(1, side + 1):
+        for j in range(1, side + 1):
+            points[i][j] = FreeFloat()
+    _solve_all((
+        (4 * points[i][j] - points[i - 1][j] - points[i + 1][j]
+            - points[i][j - 1] - points[i][j + 1], 0)
+        for i in range(1, side + 1) for j in range(1, side + 1) ), mode)
+    return points
+
+def random_sparse(size, seed, mode):
+    rng = random.Random(seed)
+    nums = [FreeFloat() for i in range(size)]
+    order = list(range(size))
+    rng.shuffle(order)
+    _solve_all((
+        (4.0 * nums[i] + rng.uniform(-1, 1) * rng.choice(nums)
+            + rng.uniform(-1, 1) * rng.choice(nums),
+            rng.uniform(-1, 1) )
+        for i in order ), mode)
+    return nums
+
+def dense(size, seed, mode):
+    rng = random.Random(seed)
+    nums = [FreeFloat() for i in range(size)]
+    _solve_all((
+        (sum((size if j == i else rng.uniform(-1, 1)) * num
+            for j, num in enumerate(nums) ),
+            rng.uniform(-1, 1) )
+        for i in range(size) ), mode)
+    return nums
+
+def complex_chain(size, seed, mode):
+    rng = random.Random(seed)
+    nums = [FreeComplex() for i in range(size)]
+    order = list(range(size))
+    rng.shuffle(order)
+    def weight():
+        return complex(rng.uniform(-1, 1), rng.uniform(-1, 1))
+    _solve_all((
+        (sum((4.0 if j == i else weight()) * nums[j]
+            for j in range(max(i - 1, 0), min(i + 2, size)) ),
+            weight() )
+        for i in order ), mode)
+    return nums
+
+def rational_dense(size, seed, mode):
+    rng = random.Random(seed)
+    nums = [FreeRational() for i in range(size)]
+    _solve_all((
+        (linear_combination(nums,
+            [rng.randint(-9, 9) for j in range(size)] ),
+            rng.randint(-9, 9) )
+        for i in range(size) ), mode)
+    return nums
+
+# Family: (function, smallest size, fraction of --max-size to go up to)
+FAMILIES = {
+    'chain': (chain, 2**6, 1),
+    'grid': (grid, 2**6, 1 / 4),
+    'random': (random_sparse, 2**6, 1 / 16),
+    'dense': (dense, 2**3, 1 / 64),
+    'complex': (complex_chain, 2**6, 1 / 2),
+    'rational': (rational_dense, 2**3, 1 / 32),
+    }
+
+def iter_cases(families=tuple(FAMILIES), *, max_size=2**12, seed=0,
+    mode='direct'
+):
+    for family in families:
+        function, size, fraction = FAMILIES[family]
+        while size <= max_size * fraction:
+            yield Case(family, size, function, seed=seed, mode=mode)
+            size *= 4 if family == 'grid' else 2
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Benchmark freenum.py' )
+    parser.add_argument('families', nargs='*', metavar='FAMILY',
+        help='families of systems to run: {} (default: all)'.format(
+            ', '.join(FAMILIES) ))
+    parser.add_argument('-n', '--max-size', type=int,
+        default=2**12,
+        help='largest number of unknowns in chains; other families'
+            ' go up to a fraction of it' )
+    parser.add_argument('-r', '--repeat', type=int,
+        default=3,
+        help='take the best of this many runs' )
+    parser.add_argument('--seed', type=int,
+        default=0,
+        help='seed for random systems' )
+    parser.add_argument('-m', '--mode', choices=MODES,
+        default='direct',
+        help='solve each system one equation at a time (default), in a'
+            ' Batch (requires NumPy) or in a lazy System' )
+    parser.add_argument('--no-memory', action='store_true',
+        help='skip the runs measuring peak memory and objects' )
+    parser.add_argument('--json', metavar='PATH',
+        help='also write results as JSON to PATH ("-" for stdout)' )
+    args = parser.parse_args()
+    for family in args.families:
+        if family not in FAMILIES:
+            parser.error('unknown family: {}'.format(family))
+
+    results = []
+    out = sys.stderr if args.json == '-' else sys.stdout
+    print('{:<9} {:>12} {:>12} {:>9}  {}'.format(
+        'family', 'time', 'peak memory', 'objects', 'parameters' ),
+        file=out)
+    for case in iter_cases(args.families or tuple(FAMILIES),
+        max_size=args.max_size, seed=args.seed, mode=args.mode
+    ):
+        result = case.run(repeat=args.repeat, memory=not args.no_memory)
+        results.append(result)
+        print('{:<9} {:>12.6f} {:>12} {:>9}  {}'.format(
+            result['family'], result['time'],
+            result.get('peak_memory', '-'), result.get('objects', '-'),
+            format_params(result['params']) ), file=out, flush=True)
+
+    if args.json is not None:
+        report = {
+            'python': sys.version,
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'arguments': vars(args),
+            'results': results,
+            }
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        else:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=1)
@@ -4,15 +4,29 @@ Periodic continued fractions.
 Aimed at Python 3.
 
 Docstrings of main classes contain examples.
-Running this as a script will launch doctest.
+Running this as a script will launch doctest; 'pcf.py survey START STOP'
+surveys period lengths of square roots (see PeriodSurvey).
 """
 
-__all__ = ['PeriodicContinuedFraction', 'FiniteContinuedFraction']
+__all__ = [
+    'PeriodicContinuedFraction', 'FiniteContinuedFraction',
+    'RealContinuedFraction',
+    'sqrt_periods', 'PeriodSurvey', 'homographic', 'bihomographic',
+    'CycleCache', 'cycle_cache', 'Instrumentation', 'BuildStats',
+    'ExpansionWriter', 'ExpansionFile' ]
 
 import fractions
 import numbers
 import math
-from functools import reduce
+import array
+import collections
+import decimal
+import itertools
+import operator
+import os
+import struct
+import sys
+import time
 
 class PeriodicContinuedFraction:
     r"""
@@ -64,7 +78,9 @@ class PeriodicContinuedFraction:
     [1; <period:> 5, 2]
     """
 
-    def __new__(cls, numerator=0, denominator=1, sqrtbase=0):
+    def __new__(cls, numerator=0, denominator=1, sqrtbase=0, *,
+        compact=False
+    ):
         if not all(
             isinstance(x, int)
             for x in (numerator, denominator, sqrtbase)
@@ -75,53 +91,261 @@ class PeriodicContinuedFraction:
         if sqrtbase < 0:
             raise ValueError("non-negative sqrtbase required")
 
-        sqroot = int_sqrt(sqrtbase)
-        if isinstance(sqroot, int):
-            return FiniteContinuedFraction(numerator + sqroot, denominator)
-
-        return super().__new__(cls)
+        instrumentation = _instrumentation
+        if instrumentation is not None:
+            start = time.perf_counter()
 
-    def __init__(self, numerator=0, denominator=1, sqrtbase=0):
-        """"""
         # Convert value to satisfy the following assertion
-        p = abs(denominator // gcd(numerator**2 - sqrtbase, denominator))
+        p = abs(denominator // math.gcd(numerator**2 - sqrtbase, denominator))
         numerator *= p; denominator *= p; sqrtbase *= p**2
-        q = abs(gcd(
+        q = math.gcd(
             (numerator**2 - sqrtbase) // denominator,
-            numerator, denominator ))
+            numerator, denominator )
         numerator //= q; denominator //= q; sqrtbase //= q**2
         assert (numerator**2 - sqrtbase) % denominator == 0
 
+        if instrumentation is not None:
+            normalised = time.perf_counter()
+
+        # sqrtbase * p**2 / q**2 is a square if and only if the original
+        # sqrtbase is, so the root of the normalised value is all we need
+        sqroot = int_sqrt(sqrtbase)
+
+        stats = None
+        if instrumentation is not None:
+            stats = instrumentation._start(numerator, denominator, sqrtbase)
+            stats.timings['normalise'] = normalised - start
+            stats.timings['int_sqrt'] = time.perf_counter() - normalised
+        if isinstance(sqroot, int):
+            if stats is not None:
+                stats._complete()
+            return FiniteContinuedFraction(numerator + sqroot, denominator)
+
+        self = super().__new__(cls)
+        # Picked up by __init__, which then does not repeat the work
         self.numerator = numerator
         self.denominator = denominator
         self.sqrtbase = sqrtbase
-        self.origin = (P, Q) = (numerator, denominator)
-        self.nextmap = nextmap = {}
-        sqroot_floor, sqroot_ceil = int_sqrt(sqrtbase)
-        while True:
-            if (P, Q) in nextmap:
-                self.periodstart = (P, Q)
-                break
-            if Q > 0:
-                quotient = (sqroot_floor + P) // Q
+        self._sqroot = sqroot
+        self._stats = stats
+        return self
+
+    def __init__(self, numerator=0, denominator=1, sqrtbase=0, *,
+        compact=False
+    ):
+        """
+        Quotients are computed lazily, as far as somebody has asked for
+        them; computed quotients are cached.  Accessing periodstart,
+        nextmap, preperiod_length, period_length or iter_period() forces
+        computation of the whole period.
+
+        >>> the_pcf = PeriodicContinuedFraction(0, 1, 10**20 + 1)
+        >>> from itertools import islice
+        >>> list(islice(the_pcf.iter_quotients(), 4))
+        [10000000000, 20000000000, 20000000000, 20000000000]
+        >>> the_pcf.period_length
+        1
+
+        With compact=True, (P, Q) states are not remembered. Instead, the
+        period is detected as starting from the first reduced state, and
+        quotients are stored in a compact buffer; nextmap is None then.
+
+        >>> the_pcf = PeriodicContinuedFraction(-19, 21, 17, compact=True)
+        >>> the_pcf.fraction
+        [-1; 3, <period:> 2, 3, 18, 1, 20, 1, 2, 3, 5, 8, 1, 12]
+        >>> the_pcf.periodstart, the_pcf.preperiod_length
+        ((81, 72), 2)
+        >>> the_pcf.nextmap is None
+        True
+        """
+        # Normalised in __new__
+        numerator = self.numerator
+        denominator = self.denominator
+        self.origin = (numerator, denominator)
+        self.compact = compact
+        # Last computed state, or None after the period has been found
+        self._frontier = self.origin
+        self._steps = None
+        self._periodstart = None
+        # States of the period, collected for cycle_cache in compact mode
+        self._period_states = None
+        if compact:
+            self._nextmap = None
+            self._quotients = _QuotientBuffer()
+            self._preperiod_length = None
+        else:
+            self._nextmap = {}
+            self._quotients = None
+
+    def _walk(self, count=None):
+        """
+        Compute up to count more quotients (all remaining ones if None).
+
+        Return False if the whole period is already computed.
+        """
+        stats = self._stats
+        if stats is None:
+            return self._walk_steps(count)
+        start = time.perf_counter()
+        walked = self._walk_steps(count)
+        stats.timings['walk'] += time.perf_counter() - start
+        if self._nextmap is not None:
+            stats.peak_nextmap = max(stats.peak_nextmap, len(self._nextmap))
+        if self._frontier is None:
+            self._stats = None
+            stats._complete()
+        return walked
+
+    def _walk_steps(self, count):
+        if self._frontier is None:
+            return False
+        P, Q = self._frontier
+        steps = self._steps
+        if steps is None:
+            steps = _iter_steps(self.sqrtbase, *self._sqroot, P, Q)
+            if self._stats is not None:
+                steps = _instrumented_steps(steps, self._stats)
+        sqroot_floor = self._sqroot[0]
+        periodstart = self._periodstart
+        nextmap = self._nextmap
+        quotients = self._quotients
+        states = self._period_states
+        for i in itertools.repeat(None) if count is None else range(count):
+            if periodstart is None and (
+                P <= sqroot_floor and
+                sqroot_floor - P < Q <= sqroot_floor + P
+            ):
+                # Value (P + sqrt(D)) / Q is reduced: it is greater than 1,
+                # and its conjugate lies between -1 and 0.  Expansion of
+                # a reduced value is purely periodic, and all the values
+                # in a period are reduced, so the period starts exactly at
+                # the first reduced state.
+                periodstart = self._enter_period(P, Q)
+                if self._frontier is None:
+                    return True
+                states = self._period_states
+            quotient, next_P, next_Q = next(steps)
+            if nextmap is not None:
+                nextmap[P, Q] = quotient, (next_P, next_Q)
             else:
-                quotient = (-sqroot_ceil - P) // -Q
-            next_P = Q * quotient - P
-            next_Q = (sqrtbase - next_P**2) // Q
-            nextmap[P, Q] = quotient, (next_P, next_Q)
+                quotients.append(quotient)
+            if states is not None:
+                states.append((P, Q))
+                if len(states) > cycle_cache.max_states:
+                    states = self._period_states = None
             P, Q = next_P, next_Q
+            if (P, Q) == periodstart:
+                self._finish()
+                return True
+        self._frontier = (P, Q)
+        self._steps = steps
+        return True
+
+    def _enter_period(self, P, Q):
+        self._periodstart = periodstart = (P, Q)
+        if self.compact:
+            self._preperiod_length = len(self._quotients)
+        cycle = cycle_cache.lookup(self.sqrtbase, periodstart)
+        if self._stats is not None:
+            self._stats.cache_hit = cycle is not None
+        if cycle is None:
+            if self.compact and cycle_cache.max_states > 0:
+                self._period_states = []
+            return periodstart
+        states, quotients = cycle
+        if self.compact:
+            for quotient in quotients:
+                self._quotients.append(quotient)
+        else:
+            nextmap = self._nextmap
+            next_states = itertools.chain(states[1:], states[:1])
+            for state, quotient, next_state in zip(
+                states, quotients, next_states
+            ):
+                nextmap[state] = quotient, next_state
+        self._frontier = None
+        self._steps = None
+        return periodstart
+
+    def _finish(self):
+        self._frontier = None
+        self._steps = None
+        if self.compact:
+            states = self._period_states
+            if states is None:
+                return
+            self._period_states = None
+            quotients = self._quotients[self._preperiod_length:]
+        else:
+            states = []; quotients = []
+            nextmap = self._nextmap
+            state = periodstart = self._periodstart
+            while True:
+                quotient, next_state = nextmap[state]
+                states.append(state); quotients.append(quotient)
+                state = next_state
+                if state == periodstart:
+                    break
+        cycle_cache.store(self.sqrtbase, states, quotients)
+
+    def _complete(self):
+        self._walk()
+
+    @property
+    def periodstart(self):
+        self._complete()
+        return self._periodstart
+
+    @property
+    def nextmap(self):
+        self._complete()
+        return self._nextmap
+
+    @property
+    def quotients(self):
+        """
+        Buffer of preperiod and period quotients (compact mode only).
+        """
+        if not self.compact:
+            raise AttributeError('quotients')
+        self._complete()
+        return self._quotients
+
+    @property
+    def preperiod_length(self):
+        if self.compact:
+            self._complete()
+            return self._preperiod_length
+        return sum(1 for quotient in self.iter_preperiod())
+
+    @property
+    def period_length(self):
+        if self.compact:
+            self._complete()
+            return len(self._quotients) - self._preperiod_length
+        return sum(1 for quotient in self.iter_period())
 
     def iter_preperiod(self):
+        if self.compact:
+            self._complete()
+            yield from itertools.islice(
+                self._quotients, self._preperiod_length )
+            return
         value = self.origin
         periodstart = self.periodstart
-        nextmap = self.nextmap
+        nextmap = self._nextmap
         while value != periodstart:
             quotient, value = nextmap[value]
             yield quotient
 
     def iter_period(self):
+        if self.compact:
+            self._complete()
+            yield from itertools.islice(
+                self._quotients, self._preperiod_length, None )
+            return
         value = periodstart = self.periodstart
-        nextmap = self.nextmap
+        nextmap = self._nextmap
         while True:
             quotient, value = nextmap[value]
             yield quotient
@@ -129,12 +353,55 @@ class PeriodicContinuedFraction:
                 return
 
     def iter_quotients(self):
+        if self.compact:
+            quotients = self._quotients
+            index = 0
+            while True:
+                while index < len(quotients):
+                    yield quotients[index]
+                    index += 1
+                if not self._walk(_WALK_CHUNK):
+                    break
+            yield from itertools.cycle(self.iter_period())
+            return
         value = self.origin
-        nextmap = self.nextmap
+        nextmap = self._nextmap
         while True:
-            quotient, value = nextmap[value]
+            try:
+                quotient, value = nextmap[value]
+            except KeyError:
+                self._walk(_WALK_CHUNK)
+                continue
             yield quotient
 
+    def iter_period_states(self):
+        """
+        Yield (P, Q) states of the period, starting from periodstart.
+
+        Quotient of state (P, Q) is the integer part of (P + sqrt(D)) / Q.
+
+        >>> list(PeriodicContinuedFraction(0, 1, 3).iter_period_states())
+        [(1, 2), (1, 1)]
+        """
+        P, Q = periodstart = self.periodstart
+        steps = _iter_steps(self.sqrtbase, *self._sqroot, P, Q)
+        for quotient, next_P, next_Q in steps:
+            yield P, Q
+            P, Q = next_P, next_Q
+            if (P, Q) == periodstart:
+                return
+
+    def iter_convergents(self):
+        """
+        Yield convergents (p, q) of the fraction.
+
+        >>> from itertools import islice
+        >>> the_pcf = PeriodicContinuedFraction(0, 1, 2)
+        >>> list(islice(the_pcf.iter_convergents(), 5))
+        [(1, 1), (3, 2), (7, 5), (17, 12), (41, 29)]
+        """
+        return _iter_convergents(self.iter_quotients())
+
     def __repr__(self):
         return (
             '{self.__class__.__name__}'
@@ -156,9 +423,101 @@ class PeriodicContinuedFraction:
 
         >>> float(PeriodicContinuedFraction(10, 11, 13))
         1.2368682977694536
+
+        See to_decimal() and to_fraction_within() for precise values.
         """
         return (self.numerator + math.sqrt(self.sqrtbase)) / self.denominator
 
+    def to_decimal(self, digits):
+        """
+        Return the value rounded to the given number of significant digits,
+        as decimal.Decimal.
+
+        Square root is computed by Newton iteration with doubling precision
+        and an a posteriori error bound; precision is raised until the bound
+        guarantees correct rounding.
+
+        >>> PeriodicContinuedFraction(10, 11, 13).to_decimal(30)
+        Decimal('1.23686829776945357210174738795')
+        >>> the_pcf = PeriodicContinuedFraction(-10**30, 1, 10**60 + 1)
+        >>> the_pcf.to_decimal(10)
+        Decimal('5.000000000E-31')
+        >>> the_pcf.to_decimal(20) == the_pcf.to_decimal(100000).scaleb(0,
+        ...     decimal.Context(prec=20) )
+        True
+        """
+        if digits < 1:
+            raise ValueError("positive number of digits required")
+        numerator = decimal.Decimal(self.numerator)
+        denominator = decimal.Decimal(self.denominator)
+        guard = 10
+        while True:
+            precision = digits + guard
+            root, root_error = _decimal_sqrt(self.sqrtbase, precision)
+            with decimal.localcontext() as context:
+                context.prec = precision
+                total = numerator + root
+                value = total / denominator
+                # Error bound for value, rounded up
+                context.prec = 5
+                context.rounding = decimal.ROUND_CEILING
+                ulp = decimal.Decimal(1).scaleb(1 - precision)
+                error = 2 * (
+                    (root * root_error + abs(total) * ulp) /
+                        abs(denominator) +
+                    abs(value) * ulp )
+            with decimal.localcontext() as context:
+                context.prec = precision + 10
+                low = value - error; high = value + error
+                context.prec = digits
+                low = +low; high = +high
+            if low == high:
+                return low
+            guard *= 2
+
+    def to_fraction_within(self, eps):
+        """
+        Return a convergent that differs from the value by at most eps,
+        as fractions.Fraction.
+
+        Convergent p/q of the fraction is within 1/(q * q') of the value,
+        where q' is the next denominator.  Number of quotients is estimated
+        in floating point, then convergents are computed by the product
+        tree and the bound is checked exactly.
+
+        >>> PeriodicContinuedFraction(0, 1, 2).to_fraction_within(1e-6)
+        Fraction(1393, 985)
+        >>> PeriodicContinuedFraction(0, 1, 2).to_fraction_within(0)
+        Traceback (most recent call last):
+            ...
+        ValueError: positive eps required
+        """
+        return _fraction_within(self.iter_quotients(), eps)
+
+    def write_to(self, fileobj, style='plain', limit=None):
+        r"""
+        Write the continued fraction to a text file, in the same format as
+        fraction.__repr__() (style='plain'), fraction.tex_repr() (style='tex')
+        or fraction.unicode_repr() (style='unicode').
+
+        Quotients are taken from iter_preperiod() and iter_period() and
+        written in bounded chunks.  With limit, output is truncated with
+        an ellipsis after that many quotients.
+
+        >>> import sys
+        >>> the_pcf = PeriodicContinuedFraction(-19, 21, 17)
+        >>> the_pcf.write_to(sys.stdout); print()
+        [-1; 3, <period:> 2, 3, 18, 1, 20, 1, 2, 3, 5, 8, 1, 12]
+        >>> the_pcf.write_to(sys.stdout, limit=5); print()
+        [-1; 3, <period:> 2, 3, 18, ...]
+        >>> the_pcf.write_to(sys.stdout, 'tex', limit=1); print()
+        [\, -1; \ldots \,]
+        >>> the_pcf.write_to(sys.stdout, 'tex', limit=3); print()
+        [\, -1; 3, \overline{2, \ldots} \,]
+        """
+        _write_pieces(fileobj, _iter_expansion_pieces(
+            self.iter_preperiod(), self.iter_period(), style, limit ))
+
     class _Fraction:
 
         def __init__(self, pcf):
@@ -166,34 +525,9 @@ class PeriodicContinuedFraction:
             self.preperiod = list(pcf.iter_preperiod())
 
         def __repr__(self, unicode=False, tex=False):
-            preperiod = []
-            delimiter = ';'
-            for i in self.preperiod:
-                preperiod.append(str(i))
-                preperiod.append(delimiter)
-                delimiter = ','
-                preperiod.append(' ')
-            preperiod = ''.join(preperiod)
-
-            period = []
-            for i in self.period:
-                period.append(str(i))
-                period.append(delimiter)
-                delimiter = ','
-                period.append(' ')
-            else:
-                del period[-2:]
-            period = ''.join(period)
-
-            if unicode:
-                # This will produce a mess in the terminal
-                period = unicode_overline(period)
-                template = '[{preperiod}{period}]'
-            elif tex:
-                template = '[\, {preperiod}\overline{{{period}}} \,]'
-            else:
-                template = '[{preperiod}<period:> {period}]'
-            return template.format(preperiod=preperiod, period=period)
+            style = 'unicode' if unicode else 'tex' if tex else 'plain'
+            return ''.join(_iter_expansion_pieces(
+                self.preperiod, self.period, style ))
 
         def unicode_repr(self):
             return self.__repr__(unicode=True)
@@ -209,14 +543,62 @@ class PeriodicContinuedFraction:
     def from_cfraction(cls, preperiod, period):
         return cls(*cls.resolve_quotients(preperiod, period))
 
+    @classmethod
+    def _from_expansion(cls, numerator, denominator, sqrtbase,
+        preperiod, period
+    ):
+        """
+        Create compact instance with known quotients, without computing
+        the period.  The value must be already normalised.
+        """
+        self = cls(numerator, denominator, sqrtbase, compact=True)
+        assert (self.numerator, self.denominator, self.sqrtbase) == (
+            numerator, denominator, sqrtbase )
+        P, Q = self.origin
+        steps = _iter_steps(sqrtbase, *self._sqroot, P, Q)
+        for quotient in preperiod:
+            self._quotients.append(quotient)
+            quotient, P, Q = next(steps)
+        for quotient in period:
+            self._quotients.append(quotient)
+        self._periodstart = (P, Q)
+        self._preperiod_length = len(preperiod)
+        self._frontier = None
+        return self
+
+    @classmethod
+    def pell(cls, sqrtbase):
+        """
+        Return fundamental solution of x**2 - sqrtbase * y**2 == +-1.
+
+        The solution is computed from the period of sqrt(sqrtbase) and is
+        returned in compact form, see PellSolution.
+
+        >>> solution = PeriodicContinuedFraction.pell(13)
+        >>> solution.expand(), solution.norm
+        ((18, 5), -1)
+        >>> PeriodicContinuedFraction.pell(16)
+        Traceback (most recent call last):
+            ...
+        ValueError: non-square sqrtbase required
+        """
+        the_pcf = cls(0, 1, sqrtbase, compact=True)
+        if not isinstance(the_pcf, cls):
+            raise ValueError("non-square sqrtbase required")
+        return PellSolution(the_pcf)
+
     @staticmethod
-    def resolve_quotients(preperiod, period):
+    def resolve_quotients(preperiod, period, *, method='tree', processes=1):
         """
         >>> PeriodicContinuedFraction.resolve_quotients([1, 5], [2, 5])
         (0, 5, 35)
+
+        See FiniteContinuedFraction.resolve_quotients() for the meaning of
+        method and processes.
         """
         (p0, q0), (p1, q1) = FiniteContinuedFraction.resolve_quotients(
-            period, return_two_last=True )
+            period, return_two_last=True,
+            method=method, processes=processes )
         a = q1; b = q0 - p1; c = -p0
         g = abs(gcd(b, 2 * a, 2 * c))
         sqrtbase = (b**2 - 4 * a * c) // g**2
@@ -230,6 +612,213 @@ class PeriodicContinuedFraction:
 
         return (numerator, denominator, sqrtbase)
 
+class Instrumentation:
+    """
+    Collector of statistics of PeriodicContinuedFraction construction.
+
+    Instrumentation is off unless an Instrumentation is active as a context
+    manager.  Every fraction constructed inside the block gets a BuildStats
+    record, appended to records; the record keeps being updated as the
+    period is computed, and is passed to callback once it is complete.
+
+    >>> with Instrumentation() as instrumentation:
+    ...     the_pcf = PeriodicContinuedFraction(5, 7, 4321)
+    ...     the_pcf.period_length
+    20
+    >>> stats, = instrumentation.records
+    >>> stats
+    <BuildStats sqrtbase=211729, complete>
+    >>> stats.iterations, stats.max_bits, stats.peak_nextmap
+    (21, 18, 21)
+    >>> sorted(stats.timings)
+    ['int_sqrt', 'normalise', 'walk']
+
+    >>> def report(stats):
+    ...     print(stats.sqrtbase, stats.iterations, stats.cache_hit)
+    >>> with Instrumentation(callback=report):
+    ...     PeriodicContinuedFraction(5, 7, 4321).period_length
+    ...     PeriodicContinuedFraction(0, 1, 4321, compact=True).period_length
+    ...     PeriodicContinuedFraction(1, 1, 4)
+    211729 1 True
+    20
+    4321 11 False
+    10
+    4 0 False
+    FiniteContinuedFraction(3, 1)
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.records = []
+        self._previous = None
+
+    def __enter__(self):
+        global _instrumentation
+        self._previous = _instrumentation
+        _instrumentation = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _instrumentation
+        _instrumentation = self._previous
+        self._previous = None
+
+    def _start(self, numerator, denominator, sqrtbase):
+        stats = BuildStats(self.callback)
+        stats.sqrtbase = sqrtbase
+        stats.max_bits = max(abs(numerator).bit_length(),
+            abs(denominator).bit_length(), sqrtbase.bit_length() )
+        self.records.append(stats)
+        return stats
+
+class BuildStats:
+    """
+    Statistics of one PeriodicContinuedFraction.
+
+    timings maps phases ('normalise', 'int_sqrt', 'walk') to seconds;
+    iterations counts steps of the (P, Q) recurrence; max_bits is the
+    largest bit length of the normalised value, P, Q and quotients;
+    peak_nextmap is the largest size of nextmap (0 in compact mode);
+    cache_hit tells if the period was taken from cycle_cache.
+    """
+
+    def __init__(self, callback=None):
+        self.sqrtbase = None
+        self.timings = {'normalise': 0.0, 'int_sqrt': 0.0, 'walk': 0.0}
+        self.iterations = 0
+        self.max_bits = 0
+        self.peak_nextmap = 0
+        self.cache_hit = False
+        self.complete = False
+        self._callback = callback
+
+    def __repr__(self):
+        return '<BuildStats sqrtbase={}{}>'.format(
+            self.sqrtbase, ', complete' if self.complete else '' )
+
+    def _complete(self):
+        self.complete = True
+        if self._callback is not None:
+            self._callback(self)
+
+# Active Instrumentation, if any
+_instrumentation = None
+
+def _instrumented_steps(steps, stats):
+    for step in steps:
+        quotient, P, Q = step
+        stats.iterations += 1
+        bits = max(abs(quotient).bit_length(),
+            abs(P).bit_length(), abs(Q).bit_length() )
+        if bits > stats.max_bits:
+            stats.max_bits = bits
+        yield step
+
+class CycleCache:
+    """
+    Least recently used cache of reduced cycles, keyed by sqrtbase.
+
+    Each cycle of reduced (P, Q) states is stored once, together with its
+    quotients, and every state is indexed.  A PeriodicContinuedFraction
+    looks its first reduced state up in the cache, and on a hit reuses the
+    stored cycle instead of walking the period.  Whole sqrtbases are
+    evicted when the estimated size exceeds max_bytes; max_bytes=0
+    disables the cache.
+
+    The module-wide instance is cycle_cache:
+    >>> cycle_cache.clear()
+    >>> PeriodicContinuedFraction(0, 1, 21).period_length
+    6
+    >>> PeriodicContinuedFraction(-10, 1, 21).period_length
+    6
+    >>> cycle_cache.hits, cycle_cache.misses, len(cycle_cache)
+    (1, 1, 1)
+    >>> PeriodicContinuedFraction(1, 2, 21).period_length
+    2
+    >>> cycle_cache.hits, cycle_cache.misses, len(cycle_cache)
+    (1, 2, 2)
+    """
+
+    # Rough size of a cached state: the (P, Q) tuple, the index entry,
+    # and the quotient
+    STATE_BYTES = 240
+
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        # sqrtbase -> [{state: (cycle, offset)}, [cycle, ...], size];
+        # cycle is (states, quotients)
+        self._entries = collections.OrderedDict()
+
+    @property
+    def max_states(self):
+        """
+        Length of the longest cycle worth collecting.
+        """
+        return self.max_bytes // self.STATE_BYTES
+
+    def __len__(self):
+        return sum(len(cycles) for index, cycles, size in
+            self._entries.values() )
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, sqrtbase, state):
+        """
+        Return (states, quotients) of the cycle, rotated to start with
+        state, or None.
+        """
+        if self.max_bytes <= 0:
+            return None
+        entry = self._entries.get(sqrtbase)
+        if entry is None or state not in entry[0]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(sqrtbase)
+        cycle, offset = entry[0][state]
+        states, quotients = entry[1][cycle]
+        return (
+            states[offset:] + states[:offset],
+            list(quotients[offset:]) + list(quotients[:offset]) )
+
+    def store(self, sqrtbase, states, quotients):
+        if not states:
+            return
+        size = len(states) * (
+            self.STATE_BYTES + sys.getsizeof(states[0][0]) +
+            sys.getsizeof(states[0][1]) )
+        if size > self.max_bytes:
+            return
+        entry = self._entries.get(sqrtbase)
+        if entry is None:
+            entry = self._entries[sqrtbase] = [{}, [], 0]
+        index, cycles, entry_size = entry
+        if states[0] in index:
+            return
+        cycle = len(cycles)
+        cycles.append((states, quotients))
+        for offset, state in enumerate(states):
+            index[state] = (cycle, offset)
+        entry[2] += size
+        self.size += size
+        self._entries.move_to_end(sqrtbase)
+        while self.size > self.max_bytes:
+            evicted, (index, cycles, entry_size) = (
+                self._entries.popitem(last=False) )
+            self.size -= entry_size
+
+cycle_cache = CycleCache()
+
+# Number of quotients computed at once while iterating
+_WALK_CHUNK = 64
+
 class FiniteContinuedFraction:
     r"""
     Finite continued fraction
@@ -283,6 +872,15 @@ class FiniteContinuedFraction:
         return super().__new__(cls)
 
     def __init__(self, numerator=0, denominator=1):
+        """
+        Quotients are computed lazily and cached, like in
+        PeriodicContinuedFraction; accessing quotients computes all of them.
+
+        >>> the_fcf = FiniteContinuedFraction(10**100, 3**200)
+        >>> from itertools import islice
+        >>> list(islice(the_fcf.iter_quotients(), 5))
+        [37648, 1, 1, 1, 1]
+        """
         q = abs(gcd(numerator, denominator))
         if denominator < 0:
             q = -q
@@ -290,15 +888,57 @@ class FiniteContinuedFraction:
 
         self.numerator = numerator
         self.denominator = denominator
-        self.quotients = quotients = []
-        while denominator > 0:
+        self._quotients = []
+        # Remaining Euclidean pair, or None after the last quotient
+        self._remainders = (numerator, denominator)
+
+    def _advance(self):
+        """
+        Compute one or more quotients.
+
+        Return False if all quotients are already computed.
+        """
+        if self._remainders is None:
+            return False
+        numerator, denominator = self._remainders
+        if self._quotients and denominator.bit_length() > 2 * _LEHMER_BITS:
+            numerator, denominator = _lehmer_quotients(
+                numerator, denominator, self._quotients )
+        else:
             quotient = numerator // denominator
-            quotients.append(quotient)
+            self._quotients.append(quotient)
             numerator, denominator = (
                 denominator, numerator - denominator * quotient )
+        if denominator > 0:
+            self._remainders = (numerator, denominator)
+        else:
+            self._remainders = None
+        return True
+
+    @property
+    def quotients(self):
+        while self._advance():
+            pass
+        return self._quotients
 
     def iter_quotients(self):
-        return iter(self.quotients)
+        quotients = self._quotients
+        index = 0
+        while True:
+            while index < len(quotients):
+                yield quotients[index]
+                index += 1
+            if not self._advance():
+                return
+
+    def iter_convergents(self):
+        """
+        Yield convergents (p, q) of the fraction.
+
+        >>> list(FiniteContinuedFraction(45, 38).iter_convergents())
+        [(1, 1), (6, 5), (13, 11), (45, 38)]
+        """
+        return _iter_convergents(self.iter_quotients())
 
     def __repr__(self):
         return (
@@ -316,27 +956,62 @@ class FiniteContinuedFraction:
     def to_fraction(self):
         return fractions.Fraction(self.numerator, self.denominator)
 
+    def to_decimal(self, digits):
+        """
+        Return the value rounded to the given number of significant digits,
+        as decimal.Decimal.
+
+        >>> FiniteContinuedFraction(10, 7).to_decimal(20)
+        Decimal('1.4285714285714285714')
+        """
+        if digits < 1:
+            raise ValueError("positive number of digits required")
+        with decimal.localcontext() as context:
+            context.prec = digits
+            return (
+                decimal.Decimal(self.numerator) /
+                decimal.Decimal(self.denominator) )
+
+    def to_fraction_within(self, eps):
+        """
+        Return a convergent that differs from the value by at most eps,
+        as fractions.Fraction.
+
+        >>> FiniteContinuedFraction(45, 38).to_fraction_within(0.01)
+        Fraction(13, 11)
+        >>> FiniteContinuedFraction(45, 38).to_fraction_within(1e-100)
+        Fraction(45, 38)
+        """
+        return _fraction_within(self.iter_quotients(), eps)
+
+    def write_to(self, fileobj, style='plain', limit=None):
+        r"""
+        Write the continued fraction to a text file, in the same format as
+        fraction.__repr__() (style='plain' or 'unicode') or
+        fraction.tex_repr() (style='tex').
+
+        Quotients are taken from iter_quotients() and written in bounded
+        chunks.  With limit, output is truncated with an ellipsis after
+        that many quotients.
+
+        >>> import sys
+        >>> the_fcf = FiniteContinuedFraction(10288, 8375)
+        >>> the_fcf.write_to(sys.stdout, 'tex'); print()
+        [\, 1; 4, 2, 1, 1, 1, 4, 1, 2, 4, 1, 2 \,]
+        >>> the_fcf.write_to(sys.stdout, limit=3); print()
+        [1; 4, 2, ...]
+        """
+        _write_pieces(fileobj, _iter_expansion_pieces(
+            self.iter_quotients(), None, style, limit ))
+
     class _Fraction:
         def __init__(self, fcf):
             self.quotients = list(fcf.quotients)
 
         def __repr__(self, tex=False):
-            quotients = []
-            delimiter = ';'
-            for i in self.quotients:
-                quotients.append(str(i))
-                quotients.append(delimiter)
-                delimiter = ','
-                quotients.append(' ')
-            else:
-                del quotients[-2:]
-            quotients = ''.join(quotients)
-
-            if tex:
-                template = '[\, {quotients} \,]'
-            else:
-                template = '[{quotients}]'
-            return template.format(quotients=quotients)
+            style = 'tex' if tex else 'plain'
+            return ''.join(_iter_expansion_pieces(
+                self.quotients, None, style ))
 
         unicode_repr = __repr__
 
@@ -351,26 +1026,1280 @@ class FiniteContinuedFraction:
     def from_cfraction(cls, quotients):
         return cls(*cls.resolve_quotients(quotients))
 
+    @classmethod
+    def _from_expansion(cls, numerator, denominator, quotients):
+        """
+        Create instance with known quotients.  The value must be already
+        reduced.
+        """
+        self = cls(numerator, denominator)
+        assert (self.numerator, self.denominator) == (numerator, denominator)
+        self._quotients = list(quotients)
+        self._remainders = None
+        return self
+
     @staticmethod
-    def resolve_quotients(quotients, return_two_last=False):
+    def resolve_quotients(quotients, return_two_last=False, *,
+        method='tree', processes=1
+    ):
         """
         >>> FiniteContinuedFraction.resolve_quotients([2, 5])
         (11, 5)
         >>> FiniteContinuedFraction.resolve_quotients([2, 5],
         ...     return_two_last=True )
         ((2, 1), (11, 5))
+
+        By default, matrices [[a, 1], [1, 0]] of quotients are multiplied
+        as a balanced product tree, so that big multiplications get operands
+        of similar sizes and can use Karatsuba algorithm.  With processes
+        other than 1, subtrees are computed in a process pool (None means
+        one process per CPU).  method='sequential' folds quotients one by
+        one instead.
+
+        >>> quotients = list(range(1, 1000))
+        >>> (FiniteContinuedFraction.resolve_quotients(quotients) ==
+        ...  FiniteContinuedFraction.resolve_quotients(quotients,
+        ...     method='sequential' ))
+        True
         """
-        p0 = 0; q0 = 1
-        p1 = 1; q1 = 0;
-        for a in quotients:
-            if not isinstance(a, int):
-                raise TypeError(a)
-            (p1, q1), (p0, q0) = (p1 * a + p0, q1 * a + q0), (p1, q1)
+        if method == 'tree':
+            quotients = list(quotients)
+            for a in quotients:
+                if not isinstance(a, int):
+                    raise TypeError(a)
+            p1, p0, q1, q0 = _quotients_matrix(quotients, processes)
+        elif method == 'sequential':
+            p1, p0, q1, q0 = _quotients_matrix_sequential(quotients)
+        else:
+            raise ValueError(method)
         if not return_two_last:
             return (p1, q1)
         else:
             return (p0, q0), (p1, q1)
 
+class PellSolution:
+    r"""
+    Fundamental solution of Pell equation x**2 - D * y**2 == norm,
+    where norm is +1 or -1.
+
+    The solution is kept in compact form: x + y sqrt(D) is the product of
+    factors (P + sqrt(D)) / Q over (P, Q) states of the period of
+    sqrt(D), and each factor has height about sqrt(D).  Expanding the
+    solution is only done on request.
+
+    >>> solution = PeriodicContinuedFraction.pell(61)
+    >>> solution.norm, solution.factors[:3]
+    (-1, [(7, 12), (5, 3), (7, 4)])
+    >>> solution.expand()
+    (29718, 3805)
+    >>> solution.digits(), solution.mod(1000)
+    (5, (718, 805))
+
+    Powers of ten are counted exactly:
+    >>> [(PeriodicContinuedFraction.pell(D).expand()[0],
+    ...     PeriodicContinuedFraction.pell(D).digits())
+    ...     for D in (11, 99, 9999)]
+    [(10, 2), (10, 2), (100, 3)]
+
+    Digit count and residues only take time linear in the period length:
+    >>> solution = PeriodicContinuedFraction.pell(10**10 + 19)
+    >>> len(solution.factors), solution.digits()
+    (124134, 63911)
+    >>> solution.mod(10**6)
+    (574410, 745639)
+    """
+
+    def __init__(self, pcf):
+        self.sqrtbase = pcf.sqrtbase
+        self.factors = list(pcf.iter_period_states())
+        preperiod = list(pcf.iter_preperiod())
+        period = list(pcf.iter_period())
+        self.quotients = preperiod + period[:-1]
+        self.norm = -1 if len(period) % 2 else 1
+
+    def __repr__(self):
+        return (
+            '<{self.__class__.__name__} for D={self.sqrtbase}: '
+            '{n} factors, norm {self.norm}>'
+            .format(self=self, n=len(self.factors)) )
+
+    def expand(self):
+        """
+        Return the solution (x, y) as integers.
+        """
+        return FiniteContinuedFraction.resolve_quotients(self.quotients)
+
+    def mod(self, modulus):
+        """
+        Return (x % modulus, y % modulus).
+        """
+        p0 = 0; q0 = 1
+        p1 = 1 % modulus; q1 = 0;
+        for a in self.quotients:
+            (p1, q1), (p0, q0) = (
+                ((p1 * a + p0) % modulus, (q1 * a + q0) % modulus),
+                (p1, q1) )
+        return (p1, q1)
+
+    def digits(self):
+        """
+        Return the number of decimal digits of x.
+
+        The logarithm is summed in floating point with an error bound;
+        x is only expanded if the bound does not determine the answer.
+        """
+        sqrtbase = self.sqrtbase
+        sqroot_floor, sqroot_ceil = int_sqrt(sqrtbase)
+        terms = []
+        error = 0.0
+        if sqrtbase < 2**52:
+            sqroot = math.sqrt(sqrtbase)
+            for P, Q in self.factors:
+                terms.append(math.log10((P + sqroot) / Q))
+        else:
+            for P, Q in self.factors:
+                terms.append(math.log10(P + sqroot_floor) - math.log10(Q))
+                error += 1 / (P + sqroot_floor)
+        # x + y sqrt(D) = 2 x -+ 1 / (x + y sqrt(D)), so log_x is off
+        # from log10(x) by about 1 / ((x + y sqrt(D))**2 ln 10), which
+        # matters when x is a power of ten; bounded here with margin
+        log_x = math.fsum(terms) - math.log10(2)
+        error += 1e-14 * (len(terms) + 1) * (1 + max(map(abs, terms)))
+        error += 4 * 10**(-2 * min(log_x + math.log10(2), 100)) / math.log(10)
+        low, high = math.floor(log_x - error), math.floor(log_x + error)
+        if low == high:
+            return low + 1
+        x, y = self.expand()
+        return high + 1 if x >= 10**high else high
+
+class RealContinuedFraction:
+    r"""
+    Continued fraction of a real number given by its value or its digits.
+
+    Floats, Fractions and other rationals are expanded exactly (a float is
+    the dyadic rational it stores, not the decimal it prints as):
+    >>> RealContinuedFraction(0.1).fraction
+    [0; 9, 1, 1801439850948197, 2]
+    >>> RealContinuedFraction(fractions.Fraction(-83, 7)).fraction
+    [-12; 7]
+
+    Decimals and digit sequences are read lazily: the leading digits give
+    an interval containing the value, quotients shared by continued
+    fractions of both ends of the interval are emitted, and the number of
+    digits read is doubled whenever the ends disagree.
+    >>> from decimal import Decimal
+    >>> RealContinuedFraction(Decimal('-3.14159')).fraction
+    [-4; 1, 6, 15, 1, 25, 1, 7, 4]
+    >>> from itertools import count, islice
+    >>> champernowne = RealContinuedFraction.from_digits(0,
+    ...     (int(d) for n in count(1) for d in str(n)) )
+    >>> list(islice(champernowne.iter_quotients(), 6))
+    [0, 8, 9, 1, 149083, 1]
+
+    Reading a prefix of the quotients only reads a prefix of the digits of
+    comparable length; the fraction of an infinite digit sequence is
+    infinite, so use islice() or write_to() with limit.
+    """
+
+    def __init__(self, x):
+        if isinstance(x, numbers.Rational):
+            quotients = FiniteContinuedFraction(
+                x.numerator, x.denominator ).iter_quotients()
+        elif isinstance(x, float):
+            quotients = FiniteContinuedFraction(
+                *x.as_integer_ratio() ).iter_quotients()
+        elif isinstance(x, decimal.Decimal):
+            if not x.is_finite():
+                raise ValueError("finite value required")
+            sign, digits, exponent = x.as_tuple()
+            if exponent >= 0:
+                integer_part = _digits_to_int(digits, 10) * 10**exponent
+                digits = ()
+            else:
+                digits = (0,) * max(-exponent - len(digits), 0) + digits
+                integer_part = _digits_to_int(digits[:exponent], 10)
+                digits = digits[exponent:]
+            quotients = _interval_quotients(
+                integer_part, digits, 10, negative=bool(sign) )
+        else:
+            raise TypeError("real number required")
+        self.value = x
+        self._quotients = []
+        self._source = quotients
+
+    @classmethod
+    def from_digits(cls, integer_part, digits, base=10):
+        """
+        Create fraction of integer_part + 0.d1 d2 d3... in given base,
+        where digits is an iterable (possibly infinite) of d1, d2, d3...
+
+        >>> RealContinuedFraction.from_digits(-2, [5]).fraction
+        [-2; 2]
+        >>> RealContinuedFraction.from_digits(0, [1, 0, 1], base=2).fraction
+        [0; 1, 1, 1, 2]
+        """
+        if not all(isinstance(x, int) for x in (integer_part, base)):
+            raise TypeError("int arguments required")
+        if base < 2:
+            raise ValueError("base must be at least 2")
+        self = cls.__new__(cls)
+        self.value = None
+        self._quotients = []
+        self._source = _interval_quotients(integer_part, digits, base)
+        return self
+
+    def __repr__(self):
+        if self.value is None:
+            return '<{} from digits>'.format(type(self).__name__)
+        return '{}({!r})'.format(type(self).__name__, self.value)
+
+    def iter_quotients(self):
+        quotients = self._quotients
+        index = 0
+        while True:
+            while index < len(quotients):
+                yield quotients[index]
+                index += 1
+            if self._source is None:
+                return
+            for quotient in self._source:
+                quotients.append(quotient)
+                break
+            else:
+                self._source = None
+
+    def iter_convergents(self):
+        """
+        Yield convergents (p, q) of the fraction.
+        """
+        return _iter_convergents(self.iter_quotients())
+
+    def write_to(self, fileobj, style='plain', limit=None):
+        """
+        Write the continued fraction to a text file, in the format of
+        FiniteContinuedFraction.write_to().
+        """
+        _write_pieces(fileobj, _iter_expansion_pieces(
+            self.iter_quotients(), None, style, limit ))
+
+    @property
+    def fraction(self):
+        """
+        All quotients, for finite expansions only.
+        """
+        return FiniteContinuedFraction._Fraction(self)
+
+    @property
+    def quotients(self):
+        return list(self.iter_quotients())
+
+def _interval_quotients(integer_part, digits, base, negative=False):
+    """
+    Yield quotients of +-(integer_part + 0.d1 d2 d3...).
+
+    With n digits read into N, the value lies in [N, N+1] / base**n;
+    the common prefix of continued fractions of the two ends is certain.
+    """
+    digits = iter(digits)
+    sign = -1 if negative else 1
+    emitted = 0
+    numerator = integer_part
+    denominator = 1
+    size = 32
+    while True:
+        chunk = list(itertools.islice(digits, size))
+        if chunk:
+            if not all(0 <= digit < base for digit in chunk):
+                raise ValueError("digits must lie in range(base)")
+            scale = base**len(chunk)
+            numerator = numerator * scale + _digits_to_int(chunk, base)
+            denominator *= scale
+        if len(chunk) < size:
+            # Digits have ended, the value is exact
+            exact = FiniteContinuedFraction(sign * numerator, denominator)
+            yield from itertools.islice(exact.iter_quotients(), emitted, None)
+            return
+        size *= 2
+        ends = (
+            FiniteContinuedFraction(sign * numerator, denominator),
+            FiniteContinuedFraction(sign * (numerator + 1), denominator) )
+        # Continued fractions of numbers between the ends share the prefix
+        # of the ends, since cylinder sets of a prefix are intervals
+        pairs = zip(*(end.iter_quotients() for end in ends))
+        for low, high in itertools.islice(pairs, emitted, None):
+            if low != high:
+                break
+            yield low
+            emitted += 1
+
+def _digits_to_int(digits, base):
+    if len(digits) <= 64:
+        value = 0
+        for digit in digits:
+            value = value * base + digit
+        return value
+    half = len(digits) // 2
+    return (
+        _digits_to_int(digits[:half], base) * base**(len(digits) - half) +
+        _digits_to_int(digits[half:], base) )
+
+def homographic(x, coefficients):
+    """
+    Yield quotients of (a*x + b) / (c*x + d), coefficients = (a, b, c, d).
+
+    x is a fraction (anything with iter_quotients()) or an iterable of
+    its quotients.  Output quotients are produced as soon as they are
+    determined (Gosper's algorithm), so that reading a prefix of the output
+    only consumes a prefix of comparable length from the input.
+
+    >>> sqrt2 = PeriodicContinuedFraction(0, 1, 2)
+    >>> from itertools import islice
+    >>> list(islice(homographic(sqrt2, (1, 1, 1, -1)), 6))
+    [5, 1, 4, 1, 4, 1]
+    >>> PeriodicContinuedFraction(3, 1, 8).fraction
+    [5; <period:> 1, 4]
+    >>> list(homographic(FiniteContinuedFraction(45, 38), (1, 1, 1, -1)))
+    [11, 1, 6]
+    >>> FiniteContinuedFraction(83, 7).fraction
+    [11; 1, 6]
+    >>> list(homographic([1, 2], (2, 0, 0, 1)))
+    [3]
+    >>> list(homographic([2], (1, 0, 1, -2)))
+    Traceback (most recent call last):
+        ...
+    ZeroDivisionError: continued fraction value is infinite
+
+    If the result is rational while x is not, the algorithm can only
+    determine the last quotient of the result when the input ends,
+    so for infinite x output may stall forever.
+    """
+    a, b, c, d = coefficients
+    x = _iter_quotients_of(x)
+    for q in x:
+        a, b, c, d = a * q + b, a, c * q + d, c
+        break
+    else:
+        raise ValueError("empty continued fraction")
+    yield from _homographic_tail(a, b, c, d, x, started=False)
+
+def bihomographic(x, y, coefficients):
+    """
+    Yield quotients of (a*x*y + b*x + c*y + d) / (e*x*y + f*x + g*y + h),
+    coefficients = (a, b, c, d, e, f, g, h).
+
+    x and y are fractions (anything with iter_quotients()) or iterables
+    of their quotients.  Output quotients are produced as soon as they are
+    determined, consuming inputs alternately.
+
+    >>> x = PeriodicContinuedFraction(0, 1, 2)
+    >>> y = PeriodicContinuedFraction(1, 1, 2)
+    >>> from itertools import islice
+    >>> sum_and_difference = (0, 1, 1, 0, 0, 1, -1, 0)  # (x + y) / (x - y)
+    >>> list(islice(bihomographic(x, y, sum_and_difference), 8))
+    [-4, 5, 1, 4, 1, 4, 1, 4]
+    >>> PeriodicContinuedFraction(1, -1, 8).fraction
+    [-4; 5, <period:> 1, 4]
+    >>> list(bihomographic([2, 5], [1, 2], (1, 0, 0, 0, 0, 0, 0, 1)))
+    [3, 3, 3]
+    >>> FiniteContinuedFraction(11 * 3, 5 * 2).fraction
+    [3; 3, 3]
+
+    Same caveat as for homographic() applies: if the result is rational
+    while the inputs are not, output may stall forever.
+    """
+    a, b, c, d, e, f, g, h = coefficients
+    x = _iter_quotients_of(x)
+    y = _iter_quotients_of(y)
+    for q in x:
+        a, b, c, d = a * q + c, b * q + d, a, b
+        e, f, g, h = e * q + g, f * q + h, e, f
+        break
+    else:
+        raise ValueError("empty continued fraction")
+    for q in y:
+        a, b, c, d = a * q + b, a, c * q + d, c
+        e, f, g, h = e * q + f, e, g * q + h, g
+        break
+    else:
+        raise ValueError("empty continued fraction")
+
+    # Both tails lie in [1, +inf] from now on
+    started = False
+    x_turn = True
+    while True:
+        if (
+            e != 0 and e + f != 0 and e + g != 0 and e + f + g + h != 0 and
+            (e > 0) == (e + f > 0) == (e + g > 0) == (e + f + g + h > 0)
+        ):
+            r = a // e
+            if (
+                r == (a + b) // (e + f) and r == (a + c) // (e + g) and
+                r == (a + b + c + d) // (e + f + g + h)
+            ):
+                yield r
+                started = True
+                a, b, c, d, e, f, g, h = (
+                    e, f, g, h, a - r * e, b - r * f, c - r * g, d - r * h )
+                continue
+        if a * f == b * e and a * g == c * e and a * h == d * e and (
+            b * g == c * f and b * h == d * f and c * h == d * g
+        ):
+            # Value does not depend on x and y
+            numerator, denominator = next(
+                (n, m) for n, m in zip((a, b, c, d), (e, f, g, h))
+                if n or m )
+            yield from _rational_quotients(numerator, denominator, started)
+            return
+        if x_turn:
+            for q in x:
+                a, b, c, d = a * q + c, b * q + d, a, b
+                e, f, g, h = e * q + g, f * q + h, e, f
+                break
+            else:
+                # x tail is infinite
+                if a or b or e or f:
+                    tail = _homographic_tail(a, b, e, f, y, started)
+                else:
+                    tail = _homographic_tail(c, d, g, h, y, started)
+                yield from tail
+                return
+        else:
+            for q in y:
+                a, b, c, d = a * q + b, a, c * q + d, c
+                e, f, g, h = e * q + f, e, g * q + h, g
+                break
+            else:
+                # y tail is infinite
+                if a or c or e or g:
+                    tail = _homographic_tail(a, c, e, g, x, started)
+                else:
+                    tail = _homographic_tail(b, d, f, h, x, started)
+                yield from tail
+                return
+        x_turn = not x_turn
+
+def _homographic_tail(a, b, c, d, x, started):
+    """
+    Yield quotients of (a*t + b) / (c*t + d), where t is given by the rest
+    of quotients x, and lies in [1, +inf].
+    """
+    for q in itertools.chain(x, (None,)):
+        while c != 0 and c + d != 0 and (c > 0) == (c + d > 0):
+            r = a // c
+            if r != (a + b) // (c + d):
+                break
+            yield r
+            started = True
+            a, b, c, d = c, d, a - r * c, b - r * d
+        if q is None:
+            # t is infinite
+            yield from _rational_quotients(a, c, started)
+            return
+        if a * d == b * c:
+            # Value does not depend on t
+            if a or c:
+                yield from _rational_quotients(a, c, started)
+            else:
+                yield from _rational_quotients(b, d, started)
+            return
+        a, b, c, d = a * q + b, a, c * q + d, c
+
+def _rational_quotients(numerator, denominator, started):
+    if denominator == 0:
+        if not started:
+            raise ZeroDivisionError("continued fraction value is infinite")
+        return iter(())
+    return FiniteContinuedFraction(numerator, denominator).iter_quotients()
+
+def _iter_quotients_of(x):
+    if hasattr(x, 'iter_quotients'):
+        return x.iter_quotients()
+    return iter(x)
+
+def _decimal_sqrt(sqrtbase, precision):
+    """
+    Return (root, error): approximation of sqrt(sqrtbase) with the given
+    number of digits, and a bound for its relative error.
+
+    Inverse square root is refined by Newton iteration, doubling the
+    precision at each step, so the cost is a few multiplications at full
+    precision.  The error is bounded by the final residual.
+
+    >>> root, error = _decimal_sqrt(2, 30)
+    >>> root, error < decimal.Decimal('1e-28')
+    (Decimal('1.41421356237309504880168872421'), True)
+    """
+    precisions = []
+    working = precision + 5
+    while working > 40:
+        precisions.append(working)
+        working = working // 2 + 5
+    with decimal.localcontext() as context:
+        context.prec = 50
+        base = decimal.Decimal(sqrtbase)
+        inverse = 1 / base.sqrt()
+        for working in reversed(precisions):
+            context.prec = working
+            inverse = inverse + inverse * (1 - base * inverse * inverse) / 2
+        context.prec = precision + 5
+        # If inverse = (1 + t) / sqrt(base), then residual is close to -2t
+        residual = 1 - base * inverse * inverse
+        context.prec = precision
+        root = base * inverse
+        context.prec = 5
+        context.rounding = decimal.ROUND_CEILING
+        error = abs(residual) + 4 * decimal.Decimal(1).scaleb(1 - precision)
+    return root, error
+
+def _fraction_within(quotients, eps):
+    """
+    Return convergent p/q of the quotients with q * q' >= 1/eps, where q'
+    is the next denominator; or the last convergent if quotients end.
+    """
+    eps = fractions.Fraction(eps)
+    if eps <= 0:
+        raise ValueError("positive eps required")
+    log_bound = math.log(eps.denominator) - math.log(eps.numerator)
+    taken = []
+    # Track logarithms of denominators of convergents in floating point,
+    # and check the bound exactly only when it is close
+    log_q0 = -math.inf; log_q1 = 0.0
+    for a in quotients:
+        taken.append(a)
+        if len(taken) < 2:
+            continue
+        ratio = math.exp(log_q0 - log_q1)
+        if a.bit_length() < 1000:
+            log_a = math.log(a + ratio)
+        else:
+            log_a = math.log(a)
+        log_q0, log_q1 = log_q1, log_q1 + log_a
+        # Margin covers rounding errors, so that the exact check usually
+        # succeeds at first attempt
+        if log_q0 + log_q1 < log_bound * (1 + 1e-12 * len(taken)) + 1e-6:
+            continue
+        (p0, exact_q0), (p1, exact_q1) = (
+            FiniteContinuedFraction.resolve_quotients(
+                taken, return_two_last=True ))
+        if exact_q0 * exact_q1 * eps.numerator >= eps.denominator:
+            return fractions.Fraction(p0, exact_q0)
+    return fractions.Fraction(
+        *FiniteContinuedFraction.resolve_quotients(taken) )
+
+def _quotients_matrix_sequential(quotients):
+    """
+    Return product of matrices [[a, 1], [1, 0]] for a in quotients,
+    as a (p1, p0, q1, q0) tuple.
+    """
+    p0 = 0; q0 = 1
+    p1 = 1; q1 = 0;
+    for a in quotients:
+        if not isinstance(a, int):
+            raise TypeError(a)
+        (p1, q1), (p0, q0) = (p1 * a + p0, q1 * a + q0), (p1, q1)
+    return p1, p0, q1, q0
+
+def _iter_convergents(quotients):
+    p0 = 0; q0 = 1
+    p1 = 1; q1 = 0;
+    for a in quotients:
+        (p1, q1), (p0, q0) = (p1 * a + p0, q1 * a + q0), (p1, q1)
+        yield (p1, q1)
+
+_PRODUCT_TREE_LEAF = 64
+
+def _quotients_matrix(quotients, processes=1):
+    """
+    Same as _quotients_matrix_sequential(), but evaluated as a balanced
+    product tree, possibly with subtrees distributed over a process pool.
+
+    >>> _quotients_matrix([1, 2, 3, 4], processes=2)
+    (43, 10, 30, 7)
+    """
+    if processes == 1 or len(quotients) < 2 * _PRODUCT_TREE_LEAF:
+        return _quotients_matrix_tree(quotients)
+    from concurrent.futures import ProcessPoolExecutor
+    pieces = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(pieces) as executor:
+        bounds = [len(quotients) * i // pieces for i in range(pieces + 1)]
+        matrices = list(executor.map( _quotients_matrix_tree,
+            (quotients[lo:hi] for lo, hi in zip(bounds, bounds[1:])) ))
+    return _matrices_product(matrices, 0, len(matrices))
+
+def _quotients_matrix_tree(quotients, lo=0, hi=None):
+    if hi is None:
+        hi = len(quotients)
+    if hi - lo <= _PRODUCT_TREE_LEAF:
+        return _quotients_matrix_sequential(quotients[lo:hi])
+    mid = (lo + hi) // 2
+    return _matrix_product(
+        _quotients_matrix_tree(quotients, lo, mid),
+        _quotients_matrix_tree(quotients, mid, hi) )
+
+def _matrices_product(matrices, lo, hi):
+    if hi - lo == 1:
+        return matrices[lo]
+    mid = (lo + hi) // 2
+    return _matrix_product(
+        _matrices_product(matrices, lo, mid),
+        _matrices_product(matrices, mid, hi) )
+
+def _matrix_product(left, right):
+    a, b, c, d = left
+    e, f, g, h = right
+    return (a * e + b * g, a * f + b * h, c * e + d * g, c * f + d * h)
+
+_LEHMER_BITS = 128
+
+def _lehmer_quotients(u, v, quotients):
+    """
+    Run a round of Lehmer algorithm on u > v > 0.
+
+    Euclidean quotients are computed from the leading bits of u and v,
+    as long as they are guaranteed to coincide with the true ones (see
+    Knuth, TAOCP vol. 2, 4.5.2, Algorithm L); then the accumulated
+    transformation is applied to u and v at full precision.
+    Append quotients to the list and return the new remainder pair.
+
+    >>> quotients = []
+    >>> u, v = _lehmer_quotients(3**400, 2**600, quotients)
+    >>> (u, v) == FiniteContinuedFraction.resolve_quotients(
+    ...     FiniteContinuedFraction(3**400, 2**600).quotients[len(quotients):]
+    ... ) and len(quotients) > 10
+    True
+    """
+    shift = u.bit_length() - _LEHMER_BITS
+    x = u >> shift; y = v >> shift
+    A, B, C, D = 1, 0, 0, 1
+    while y + C != 0 and y + D != 0:
+        q = (x + A) // (y + C)
+        if q != (x + B) // (y + D):
+            break
+        quotients.append(q)
+        A, C = C, A - q * C
+        B, D = D, B - q * D
+        x, y = y, x - q * y
+    if B == 0:
+        q = u // v
+        quotients.append(q)
+        return v, u - q * v
+    return A * u + B * v, C * u + D * v
+
+def _iter_steps(sqrtbase, sqroot_floor, sqroot_ceil, P, Q):
+    """
+    Yield (quotient, next_P, next_Q) for consecutive states of expansion
+    of (P + sqrt(sqrtbase)) / Q.
+    """
+    while True:
+        if Q > 0:
+            quotient = (sqroot_floor + P) // Q
+        else:
+            quotient = (-sqroot_ceil - P) // -Q
+        P = Q * quotient - P
+        Q = (sqrtbase - P**2) // Q
+        yield quotient, P, Q
+
+class _QuotientBuffer:
+    """
+    Append-only sequence of quotients.
+
+    Quotients are stored in a signed 64-bit array until some quotient does
+    not fit there; then the storage falls back to a list.
+
+    >>> buffer = _QuotientBuffer()
+    >>> buffer.append(-1); buffer.append(2**70)
+    >>> list(buffer), len(buffer), buffer[1] == 2**70
+    ([-1, 1180591620717411303424], 2, True)
+    """
+    __slots__ = ['items']
+
+    def __init__(self):
+        self.items = array.array('q')
+
+    def append(self, quotient):
+        try:
+            self.items.append(quotient)
+        except OverflowError:
+            self.items = list(self.items)
+            self.items.append(quotient)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __iter__(self):
+        return iter(self.items)
+
+def sqrt_periods(sqrtbases, *, processes=None, chunksize=4096):
+    """
+    Compute continued fractions of square roots of many integers at once.
+
+    This is the batch counterpart of PeriodicContinuedFraction(0, 1, D):
+    yield (sqrtbase, preperiod, period) triples in the order of sqrtbases.
+    For a perfect square the period is empty.
+
+    >>> for D, preperiod, period in sqrt_periods(range(2, 8), processes=1):
+    ...     print(D, preperiod, period)
+    2 [1] [2]
+    3 [1] [1, 2]
+    4 [2] []
+    5 [2] [4]
+    6 [2] [2, 4]
+    7 [2] [1, 1, 1, 4]
+    >>> PeriodicContinuedFraction(0, 1, 7).fraction
+    [2; <period:> 1, 1, 1, 4]
+
+    The sqrtbases are split into chunks of chunksize items, and chunks are
+    distributed over a pool of processes (default is one per CPU,
+    processes=1 computes everything in the current process).
+    Chunks with all sqrtbases below 2**62 are computed on int64 arrays
+    if NumPy is available; anything else falls back to Python ints.
+
+    >>> D = 10**30 + 1
+    >>> next(sqrt_periods([D], processes=1))[1:] == (
+    ...     PeriodicContinuedFraction(0, 1, D).fraction.preperiod,
+    ...     PeriodicContinuedFraction(0, 1, D).fraction.period )
+    True
+    >>> list(sqrt_periods([-1], processes=1))
+    Traceback (most recent call last):
+        ...
+    ValueError: non-negative sqrtbase required
+    """
+    chunks = _iter_chunks(sqrtbases, chunksize)
+    if processes == 1:
+        results = map(_sqrt_periods_chunk, chunks)
+        for chunk in results:
+            yield from chunk
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes) as executor:
+        results = _imap_bounded(executor, _sqrt_periods_chunk, chunks,
+            window=2 * (processes or os.cpu_count() or 1) )
+        for chunk in results:
+            yield from chunk
+
+def _iter_chunks(iterable, chunksize):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def _imap_bounded(executor, function, iterable, window):
+    """
+    Ordered executor.map() that keeps at most window tasks in flight.
+    """
+    futures = collections.deque()
+    for item in iterable:
+        futures.append(executor.submit(function, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+def _sqrt_periods_chunk(sqrtbases):
+    sqrtbases = [operator.index(sqrtbase) for sqrtbase in sqrtbases]
+    if any(sqrtbase < 0 for sqrtbase in sqrtbases):
+        raise ValueError("non-negative sqrtbase required")
+    if max(sqrtbases) < 2**62:
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            return _sqrt_periods_numpy(numpy, sqrtbases)
+    return [
+        (sqrtbase,) + _sqrt_period(sqrtbase)
+        for sqrtbase in sqrtbases ]
+
+def _sqrt_period(sqrtbase):
+    sqroot = int_sqrt(sqrtbase)
+    if isinstance(sqroot, int):
+        return [sqroot], []
+    sqroot_floor, sqroot_ceil = sqroot
+    # The recurrence of PeriodicContinuedFraction.__init__, started at
+    # (0, 1).  The period of sqrt(D) ends with the only state having Q == 1.
+    P, Q = sqroot_floor, sqrtbase - sqroot_floor**2
+    period = []
+    while True:
+        quotient = (sqroot_floor + P) // Q
+        period.append(quotient)
+        if Q == 1:
+            return [sqroot_floor], period
+        P = Q * quotient - P
+        Q = (sqrtbase - P**2) // Q
+
+def _isqrt_numpy(numpy, D):
+    """
+    Return floor square roots of an int64 array.
+    """
+    root = numpy.sqrt(D.astype(numpy.float64)).astype(numpy.int64)
+    # Fix rounding errors of float square root
+    while True:
+        too_big = root * root > D
+        if not too_big.any():
+            break
+        root -= too_big
+    while True:
+        too_small = D - root * root > 2 * root
+        if not too_small.any():
+            break
+        root += too_small
+    return root
+
+def _iter_sqrt_steps_numpy(numpy, D, root):
+    """
+    Iterate periods of sqrt(D) for all nonsquare D in parallel, dropping
+    those whose period has ended; yield (indices, quotients) arrays of
+    each step.
+    """
+    index = numpy.flatnonzero(root * root != D)
+    P = root[index]; Q = D[index] - P * P
+    active_D = D[index]; active_root = P.copy()
+    while index.size:
+        quotient = (active_root + P) // Q
+        yield index, quotient
+        going = Q != 1
+        P = Q * quotient - P
+        Q = (active_D - P * P) // Q
+        index = index[going]; P = P[going]; Q = Q[going]
+        active_D = active_D[going]; active_root = active_root[going]
+
+def _sqrt_periods_numpy(numpy, sqrtbases):
+    D = numpy.array(sqrtbases, dtype=numpy.int64)
+    root = _isqrt_numpy(numpy, D)
+    step_indices = []; step_quotients = []
+    for index, quotient in _iter_sqrt_steps_numpy(numpy, D, root):
+        step_indices.append(index)
+        step_quotients.append(quotient)
+
+    if step_indices:
+        indices = numpy.concatenate(step_indices)
+        quotients = numpy.concatenate(step_quotients)
+        order = numpy.argsort(indices, kind='stable')
+        quotients = quotients[order].tolist()
+        lengths = numpy.bincount(indices, minlength=len(D)).tolist()
+    else:
+        quotients = []
+        lengths = [0] * len(D)
+
+    results = []
+    position = 0
+    for sqrtbase, sqroot, length in zip(sqrtbases, root.tolist(), lengths):
+        period = quotients[position:position+length]
+        position += length
+        results.append((sqrtbase, [sqroot], period))
+    return results
+
+class PeriodSurvey:
+    """
+    Streaming statistics of period lengths of sqrt(D) over a range of D.
+
+    Squares are only counted; for the other sqrtbases the survey keeps
+    a histogram of period lengths, the longest period with the smallest D
+    having it, and the number of odd periods (those D for which
+    x**2 - D*y**2 == -1 is solvable).
+
+    >>> survey = PeriodSurvey(2, 1000)
+    >>> for progress in survey.run(processes=1, shardsize=256):
+    ...     print(progress.next, progress.done)
+    258 False
+    514 False
+    770 False
+    1000 True
+    >>> survey.count, survey.squares, survey.odd
+    (998, 30, 152)
+    >>> survey.max_length, survey.argmax
+    (60, 919)
+    >>> PeriodicContinuedFraction(0, 1, 919).period_length
+    60
+    >>> sorted(survey.histogram.items())[:3]
+    [(1, 31), (2, 149), (3, 7)]
+
+    Workers compute shards of shardsize sqrtbases each and only send back
+    their statistics, so memory use does not depend on the range.  The
+    state can be saved with save() after any step of run() and loaded
+    with load() to resume the survey where it stopped.
+    """
+
+    def __init__(self, start, stop):
+        start = operator.index(start); stop = operator.index(stop)
+        if start < 0:
+            raise ValueError("non-negative sqrtbase required")
+        self.start = start
+        self.stop = stop
+        # First sqrtbase not surveyed yet
+        self.next = start
+        self.count = 0
+        self.squares = 0
+        self.odd = 0
+        self.max_length = 0
+        self.argmax = None
+        self.histogram = collections.Counter()
+
+    def __repr__(self):
+        return '<PeriodSurvey of [{}, {}), next {}>'.format(
+            self.start, self.stop, self.next )
+
+    @property
+    def done(self):
+        return self.next >= self.stop
+
+    def run(self, *, processes=None, shardsize=2**16):
+        """
+        Survey the rest of the range, yielding self after each shard.
+
+        Shards are distributed over a pool of processes (default is one
+        per CPU, processes=1 computes everything in the current process)
+        and merged in order, so the surveyed part is always [start, next).
+        """
+        shards = (
+            (lo, min(lo + shardsize, self.stop))
+            for lo in range(self.next, self.stop, shardsize) )
+        if processes == 1:
+            for shard in map(_survey_shard, shards):
+                self._merge(shard)
+                yield self
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(processes) as executor:
+            results = _imap_bounded(executor, _survey_shard, shards,
+                window=2 * (processes or os.cpu_count() or 1) )
+            for shard in results:
+                self._merge(shard)
+                yield self
+
+    def _merge(self, shard):
+        lo, hi, count, squares, odd, max_length, argmax, histogram = shard
+        assert lo == self.next
+        self.next = hi
+        self.count += count
+        self.squares += squares
+        self.odd += odd
+        if max_length > self.max_length:
+            self.max_length = max_length
+            self.argmax = argmax
+        self.histogram.update(histogram)
+
+    def to_json(self):
+        state = dict(vars(self))
+        state['histogram'] = sorted(self.histogram.items())
+        return state
+
+    @classmethod
+    def from_json(cls, state):
+        self = cls(state['start'], state['stop'])
+        for name in ('next', 'count', 'squares', 'odd',
+            'max_length', 'argmax'
+        ):
+            setattr(self, name, state[name])
+        self.histogram.update(dict(state['histogram']))
+        return self
+
+    def save(self, path):
+        """
+        Write state as JSON to path, atomically replacing the old file.
+        """
+        import json
+        temporary = '{}.tmp'.format(path)
+        with open(temporary, 'w') as f:
+            json.dump(self.to_json(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        import json
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+def _survey_shard(shard):
+    lo, hi = shard
+    count = squares = odd = max_length = 0
+    argmax = None
+    histogram = collections.Counter()
+    for chunk in _iter_chunks(range(lo, hi), 4096):
+        for sqrtbase, length in zip(chunk, _sqrt_period_lengths(chunk)):
+            count += 1
+            if length == 0:
+                squares += 1
+                continue
+            histogram[length] += 1
+            odd += length & 1
+            if length > max_length:
+                max_length = length
+                argmax = sqrtbase
+    return lo, hi, count, squares, odd, max_length, argmax, histogram
+
+def _sqrt_period_lengths(sqrtbases):
+    """
+    Return list of period lengths of sqrt(D), 0 for squares.
+    """
+    if sqrtbases and max(sqrtbases) < 2**62:
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            return _sqrt_period_lengths_numpy(numpy, sqrtbases)
+    lengths = []
+    for sqrtbase in sqrtbases:
+        sqroot = int_sqrt(sqrtbase)
+        if isinstance(sqroot, int):
+            lengths.append(0)
+            continue
+        # See _sqrt_period()
+        sqroot_floor = sqroot[0]
+        P, Q = sqroot_floor, sqrtbase - sqroot_floor**2
+        length = 1
+        while Q != 1:
+            quotient = (sqroot_floor + P) // Q
+            P = Q * quotient - P
+            Q = (sqrtbase - P**2) // Q
+            length += 1
+        lengths.append(length)
+    return lengths
+
+def _sqrt_period_lengths_numpy(numpy, sqrtbases):
+    D = numpy.array(sqrtbases, dtype=numpy.int64)
+    root = _isqrt_numpy(numpy, D)
+    lengths = numpy.zeros(len(D), dtype=numpy.int64)
+    for index, quotient in _iter_sqrt_steps_numpy(numpy, D, root):
+        lengths[index] += 1
+    return lengths.tolist()
+
+class ExpansionWriter:
+    """
+    Writer of continued fraction expansions in a compact binary format.
+
+    The file consists of an 8-byte header, records, an index and a trailer.
+    A record holds the value (numerator, denominator, and sqrtbase for
+    periodic fractions) and the quotients, all as LEB128 varints, signed
+    ones in zigzag encoding.  The index is a table of (key, offset) pairs
+    of unsigned 64-bit integers sorted by key; the trailer holds index
+    offset and size.  Keys default to sqrtbase of periodic fractions.
+
+    Only the index is kept in memory while writing; it is sorted on close()
+    if keys were not added in increasing order.  See ExpansionFile for
+    reading.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.keys = array.array('Q')
+        self.offsets = array.array('Q')
+        fileobj.write(_EXPANSION_MAGIC)
+        self.position = len(_EXPANSION_MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def add(self, fraction, key=None):
+        if key is None:
+            if not isinstance(fraction, PeriodicContinuedFraction):
+                raise TypeError("key required for finite fractions")
+            key = fraction.sqrtbase
+        if not 0 <= key < 2**64:
+            raise ValueError("key must fit in 64 bits, received {}"
+                .format(key) )
+        record = bytearray()
+        if isinstance(fraction, PeriodicContinuedFraction):
+            preperiod = list(fraction.iter_preperiod())
+            period = list(fraction.iter_period())
+            _write_varint(record, 1)
+            _write_varint(record, _zigzag(fraction.numerator))
+            _write_varint(record, _zigzag(fraction.denominator))
+            _write_varint(record, fraction.sqrtbase)
+            _write_varint(record, len(preperiod))
+            quotients = preperiod + period
+        elif isinstance(fraction, FiniteContinuedFraction):
+            _write_varint(record, 0)
+            _write_varint(record, _zigzag(fraction.numerator))
+            _write_varint(record, _zigzag(fraction.denominator))
+            quotients = fraction.quotients
+        else:
+            raise TypeError(fraction)
+        _write_varint(record, len(quotients))
+        for quotient in quotients:
+            _write_varint(record, _zigzag(quotient))
+        self.keys.append(key)
+        self.offsets.append(self.position)
+        self.fileobj.write(record)
+        self.position += len(record)
+
+    def close(self):
+        keys, offsets = self.keys, self.offsets
+        if any(a >= b for a, b in zip(keys, itertools.islice(keys, 1, None))):
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            keys = array.array('Q', (keys[i] for i in order))
+            offsets = array.array('Q', (offsets[i] for i in order))
+            for a, b in zip(keys, itertools.islice(keys, 1, None)):
+                if a == b:
+                    raise ValueError("duplicate key {}".format(a))
+        index = array.array('Q')
+        for key, offset in zip(keys, offsets):
+            index.append(key); index.append(offset)
+        if sys.byteorder != 'little':
+            index.byteswap()
+        self.fileobj.write(index.tobytes())
+        self.fileobj.write(_EXPANSION_TRAILER.pack(
+            self.position, len(keys), _EXPANSION_MAGIC ))
+
+class ExpansionFile:
+    """
+    Memory-mapped reader of files written by ExpansionWriter.
+
+    Looking up a key is a binary search in the index, and only the record
+    of that key is decoded.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryFile() as f:
+    ...     with ExpansionWriter(f) as writer:
+    ...         for D in (7, 3, 2):
+    ...             writer.add(PeriodicContinuedFraction(0, 1, D))
+    ...         writer.add(PeriodicContinuedFraction(-19, 21, 17))
+    ...         writer.add(FiniteContinuedFraction(45, 38), key=0)
+    ...     f.flush()
+    ...     with ExpansionFile(f) as expansions:
+    ...         print(len(expansions), list(expansions.keys()))
+    ...         print(expansions.quotients(7))
+    ...         print(expansions[7497], expansions[7497].fraction)
+    ...         print(expansions[0].fraction, 5 in expansions)
+    5 [0, 2, 3, 7, 7497]
+    ([2], [1, 1, 1, 4])
+    PeriodicContinuedFraction(-399, 441, 7497) [-1; 3, <period:> 2, 3, 18, 1, 20, 1, 2, 3, 5, 8, 1, 12]
+    [1; 5, 2, 3] False
+    """
+
+    def __init__(self, file):
+        import mmap
+        if isinstance(file, (str, bytes, os.PathLike)):
+            with open(file, 'rb') as f:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = self.mmap
+        if buffer[:len(_EXPANSION_MAGIC)] != _EXPANSION_MAGIC:
+            raise ValueError("not an expansion file")
+        self.index_offset, self.count, magic = _EXPANSION_TRAILER.unpack_from(
+            buffer, len(buffer) - _EXPANSION_TRAILER.size )
+        if magic != _EXPANSION_MAGIC:
+            raise ValueError("truncated expansion file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.mmap.close()
+
+    def __len__(self):
+        return self.count
+
+    def _key(self, i):
+        return _EXPANSION_INDEX_ITEM.unpack_from(
+            self.mmap, self.index_offset + 16 * i )
+
+    def keys(self):
+        for i in range(self.count):
+            yield self._key(i)[0]
+
+    def _offset(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, offset = self._key(mid)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return offset
+        return None
+
+    def __contains__(self, key):
+        return self._offset(key) is not None
+
+    def _read(self, key):
+        offset = self._offset(key)
+        if offset is None:
+            raise KeyError(key)
+        buffer = self.mmap
+        kind, offset = _read_varint(buffer, offset)
+        numerator, offset = _read_varint(buffer, offset)
+        denominator, offset = _read_varint(buffer, offset)
+        value = [_unzigzag(numerator), _unzigzag(denominator)]
+        if kind == 1:
+            sqrtbase, offset = _read_varint(buffer, offset)
+            preperiod_length, offset = _read_varint(buffer, offset)
+            value.append(sqrtbase)
+        count, offset = _read_varint(buffer, offset)
+        quotients = []
+        for i in range(count):
+            quotient, offset = _read_varint(buffer, offset)
+            quotients.append(_unzigzag(quotient))
+        if kind == 1:
+            return value, (
+                quotients[:preperiod_length], quotients[preperiod_length:] )
+        return value, (quotients,)
+
+    def quotients(self, key):
+        """
+        Return (preperiod, period) of a periodic fraction, or (quotients,)
+        of a finite one.
+        """
+        value, quotients = self._read(key)
+        return quotients
+
+    def __getitem__(self, key):
+        """
+        Return the fraction; periodic ones are in compact mode.
+        """
+        value, quotients = self._read(key)
+        if len(value) == 3:
+            return PeriodicContinuedFraction._from_expansion(
+                *value, *quotients )
+        return FiniteContinuedFraction._from_expansion(*value, *quotients)
+
+_EXPANSION_MAGIC = b'PCFX\x00\x00\x00\x01'
+_EXPANSION_TRAILER = struct.Struct('<QQ8s')
+_EXPANSION_INDEX_ITEM = struct.Struct('<QQ')
+
+def _zigzag(n):
+    return 2 * n if n >= 0 else -2 * n - 1
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -(n >> 1) - 1
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(buffer, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
 def int_sqrt(A):
     """
     Square root implemented in purely integer operations.
@@ -378,6 +2307,9 @@ def int_sqrt(A):
     Return exact square root, if it is integer.
     Otherwise, return a (root_floor, root_ceil) pair.
 
+    Based on math.isqrt(); quadratic residues modulo small numbers rule out
+    most non-squares before the root is checked by squaring.
+
     >>> int_sqrt(9)
     3
     >>> int_sqrt(10)
@@ -401,22 +2333,35 @@ def int_sqrt(A):
     """
     if A < 0:
         raise ValueError('math domain error')
-    if A == 0 or A == 1:
-        return A
-
-    floor, ceil = A-1, A
-    while not floor**2 < A < ceil**2:
-        ceil = (floor + A // -floor // -1) // -2 // -1
-        floor = ceil - 1
-        if A == ceil**2:
-            return ceil
-    return floor, ceil
-
-def gcd(*args, _gcd=fractions.gcd):
+    root = math.isqrt(A)
+    if (
+        _SQUARE_RESIDUES_64[A & 63] and
+        _SQUARE_RESIDUES_63[A % 63] and
+        _SQUARE_RESIDUES_65[A % 65] and
+        _SQUARE_RESIDUES_11[A % 11] and
+        root * root == A
+    ):
+        return root
+    return root, root + 1
+
+def _square_residues(modulus):
+    residues = bytearray(modulus)
+    for x in range(modulus):
+        residues[x * x % modulus] = 1
+    return bytes(residues)
+
+# Perfect square pre-filter: only about 1/100 of non-squares pass all four,
+# so the full-size multiplication is rarely needed
+_SQUARE_RESIDUES_64 = _square_residues(64)
+_SQUARE_RESIDUES_63 = _square_residues(63)
+_SQUARE_RESIDUES_65 = _square_residues(65)
+_SQUARE_RESIDUES_11 = _square_residues(11)
+
+def gcd(*args):
     """
     Return greatest common divisor of all arguments.
 
-    Based on fractions.gcd().
+    Based on math.gcd().
 
     >>> gcd(6, 10, 15)
     1
@@ -424,13 +2369,136 @@ def gcd(*args, _gcd=fractions.gcd):
     2
     >>> gcd(15)
     15
+    >>> gcd(-15, 10)
+    5
     """
-    return reduce(_gcd, args)
+    return math.gcd(*args)
+
+def _iter_expansion_pieces(preperiod, period, style, limit=None):
+    """
+    Yield pieces of text representation of a continued fraction.
+
+    period is None for finite fractions.
+    """
+    if style not in {'plain', 'tex', 'unicode'}:
+        raise ValueError(style)
+    if style == 'tex':
+        opening, closing, ellipsis = '[\\, ', ' \\,]', '\\ldots'
+    else:
+        opening, closing = '[', ']'
+        ellipsis = '...' if style == 'plain' else '\N{HORIZONTAL ELLIPSIS}'
+    yield opening
+    count = 0
+    delimiter = ';'
+    if period is not None:
+        for quotient in preperiod:
+            if limit is not None and count >= limit:
+                yield ellipsis
+                yield closing
+                return
+            yield str(quotient) + delimiter + ' '
+            delimiter = ','
+            count += 1
+        if style == 'tex':
+            yield '\\overline{'
+            closing = '}' + closing
+        elif style == 'plain':
+            yield '<period:> '
+        quotients = period
+    else:
+        quotients = preperiod
+    separator = ''
+    for quotient in quotients:
+        if limit is not None and count >= limit:
+            piece = separator + ellipsis
+            if style == 'unicode' and period is not None:
+                piece = unicode_overline(piece)
+            yield piece
+            break
+        piece = separator + str(quotient)
+        if style == 'unicode' and period is not None:
+            # This will produce a mess in the terminal
+            piece = unicode_overline(piece)
+        yield piece
+        separator = delimiter + ' '
+        delimiter = ','
+        count += 1
+    yield closing
+
+_WRITE_CHUNK = 2**16
+
+def _write_pieces(fileobj, pieces):
+    chunk = []
+    size = 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= _WRITE_CHUNK:
+            fileobj.write(''.join(chunk))
+            chunk.clear()
+            size = 0
+    fileobj.write(''.join(chunk))
 
 def unicode_overline(s):
     return ''.join(y for x in s for y in (x, '\N{COMBINING OVERLINE}'))
 
+def _survey_main(args):
+    import json
+    import time
+    if args.checkpoint is not None and os.path.exists(args.checkpoint):
+        survey = PeriodSurvey.load(args.checkpoint)
+        if (survey.start, survey.stop) != (args.start, args.stop):
+            sys.exit('{}: checkpoint is for range [{}, {})'.format(
+                args.checkpoint, survey.start, survey.stop ))
+    else:
+        survey = PeriodSurvey(args.start, args.stop)
+
+    saved = time.monotonic()
+    try:
+        for progress in survey.run(
+            processes=args.processes, shardsize=args.shardsize
+        ):
+            if (
+                args.checkpoint is not None and
+                time.monotonic() - saved >= args.interval
+            ):
+                survey.save(args.checkpoint)
+                saved = time.monotonic()
+                print('surveyed up to {}'.format(survey.next),
+                    file=sys.stderr, flush=True )
+    finally:
+        if args.checkpoint is not None:
+            survey.save(args.checkpoint)
+    json.dump(survey.to_json(), sys.stdout, indent=1)
+    print()
+
 if __name__ == '__main__':
-    import doctest
-    doctest.testmod()
+    if len(sys.argv) == 1:
+        import doctest
+        doctest.testmod()
+        sys.exit()
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Periodic continued fractions.  '
+            'Without arguments, run doctest.' )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    survey_parser = subparsers.add_parser('survey',
+        help='survey period lengths of sqrt(D) for D in [start, stop)',
+        description='Survey period lengths of sqrt(D) for D in '
+            '[start, stop) and print statistics as JSON.' )
+    survey_parser.add_argument('start', type=int)
+    survey_parser.add_argument('stop', type=int)
+    survey_parser.add_argument('-p', '--processes', type=int,
+        help='worker processes (default: one per CPU)' )
+    survey_parser.add_argument('-s', '--shardsize', type=int,
+        default=2**16,
+        help='sqrtbases per task' )
+    survey_parser.add_argument('-c', '--checkpoint', metavar='PATH',
+        help='save state to PATH and resume from it if it exists' )
+    survey_parser.add_argument('-i', '--interval', type=float,
+        default=60,
+        help='seconds between checkpoints' )
+    args = parser.parse_args()
+    _survey_main(args)
 
@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+
+"""
+Benchmarks for pcf.py.
+
+Running this as a script times four groups of cases and prints the best
+time and the peak traced memory of each:
+
+construction
+    PeriodicContinuedFraction over ranges of sqrtbase (walking the whole
+    period) and over sqrtbase of growing bit length (normalisation and a
+    prefix of quotients only, since the period grows like sqrt(sqrtbase));
+resolve
+    convergents of random quotient lists of growing length, by
+    sequential folding and by the balanced product tree;
+finite
+    FiniteContinuedFraction of random rationals of growing bit length;
+repr
+    text representation of long expansions, through repr() and write_to().
+
+With --json, results are also written as JSON, so that runs before and
+after a change can be compared.
+"""
+
+import io
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from pcf import (
+    PeriodicContinuedFraction, FiniteContinuedFraction, cycle_cache )
+
+def best_time(function, *args, repeat=3, setup=None, **kwargs):
+    best = None
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def peak_memory(function, *args, setup=None, **kwargs):
+    """
+    Return peak memory in bytes allocated while running function, as
+    traced by tracemalloc.  This is a separate run, since tracing slows
+    down allocation.
+    """
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+class Case:
+    """
+    A single benchmark: function(*args) run with setup() before each run.
+    """
+
+    def __init__(self, group, name, params, function, *args, setup=None):
+        self.group = group
+        self.name = name
+        self.params = params
+        self.function = function
+        self.args = args
+        self.setup = setup
+
+    def run(self, repeat=3, memory=True):
+        result = {
+            'group': self.group,
+            'name': self.name,
+            'params': self.params,
+            'time': best_time(self.function, *self.args,
+                repeat=repeat, setup=self.setup ),
+            }
+        if memory:
+            result['peak_memory'] = peak_memory(self.function, *self.args,
+                setup=self.setup )
+        return result
+
+def _random_int(rng, bits):
+    return rng.getrandbits(bits) | (1 << (bits - 1))
+
+def _nonsquare(sqrtbase):
+    while True:
+        pcf = PeriodicContinuedFraction(0, 1, sqrtbase)
+        if isinstance(pcf, PeriodicContinuedFraction):
+            return sqrtbase
+        sqrtbase += 1
+
+def _construct_range(start, count):
+    for sqrtbase in range(start, start + count):
+        pcf = PeriodicContinuedFraction(0, 1, sqrtbase)
+        if isinstance(pcf, PeriodicContinuedFraction):
+            pcf.period_length
+
+def _construct_prefix(numerator, denominator, sqrtbase, terms):
+    pcf = PeriodicContinuedFraction(numerator, denominator, sqrtbase)
+    for quotient in itertools.islice(pcf.iter_quotients(), terms):
+        pass
+
+def _expand_finite(numerator, denominator):
+    FiniteContinuedFraction(numerator, denominator).quotients
+
+def _write_to(fraction, style):
+    fraction.write_to(io.StringIO(), style)
+
+def construction_cases(*, max_bits=2**12, seed=0):
+    for start, count in ((2, 2**10), (2**20, 2**8), (2**30, 2**4)):
+        yield Case('construction', 'range',
+            {'start': start, 'count': count},
+            _construct_range, start, count,
+            setup=cycle_cache.clear )
+    rng = random.Random(seed)
+    bits = 16
+    while bits <= max_bits:
+        sqrtbase = _nonsquare(_random_int(rng, bits))
+        numerator = _random_int(rng, bits)
+        denominator = _random_int(rng, bits)
+        yield Case('construction', 'bits',
+            {'bits': bits, 'terms': 2**8},
+            _construct_prefix, numerator, denominator, sqrtbase, 2**8,
+            setup=cycle_cache.clear )
+        bits *= 2
+
+def resolve_cases(*, max_length=2**17, processes=1, seed=0):
+    rng = random.Random(seed)
+    resolve = FiniteContinuedFraction.resolve_quotients
+    length = 2**6
+    while length <= max_length:
+        quotients = [rng.randint(1, 100) for i in range(length)]
+        yield Case('resolve', 'sequential', {'length': length},
+            lambda quotients: resolve(quotients, method='sequential'),
+            quotients )
+        yield Case('resolve', 'tree',
+            {'length': length, 'processes': processes},
+            lambda quotients: resolve(quotients,
+                method='tree', processes=processes ),
+            quotients )
+        length *= 2
+
+def finite_cases(*, max_bits=2**16, seed=0):
+    rng = random.Random(seed)
+    bits = 2**6
+    while bits <= max_bits:
+        yield Case('finite', 'expand', {'bits': bits},
+            _expand_finite, _random_int(rng, bits), _random_int(rng, bits) )
+        bits *= 4
+
+def repr_cases(*, max_length=2**17, seed=0):
+    rng = random.Random(seed)
+    sqrtbase = 2
+    while True:
+        pcf = PeriodicContinuedFraction(0, 1, sqrtbase)
+        if pcf.period_length >= 2**10:
+            break
+        sqrtbase = 4 * sqrtbase + 3
+    yield Case('repr', 'periodic repr',
+        {'sqrtbase': sqrtbase, 'length': pcf.period_length},
+        lambda pcf: repr(pcf.fraction), pcf )
+    for style in ('plain', 'tex', 'unicode'):
+        yield Case('repr', 'periodic write_to',
+            {'sqrtbase': sqrtbase, 'length': pcf.period_length,
+                'style': style},
+            _write_to, pcf, style )
+    length = 2**10
+    while length <= max_length:
+        quotients = [rng.randint(1, 100) for i in range(length)]
+        fcf = FiniteContinuedFraction(
+            *FiniteContinuedFraction.resolve_quotients(quotients) )
+        fcf.quotients
+        yield Case('repr', 'finite repr', {'length': length},
+            lambda fcf: repr(fcf.fraction), fcf )
+        yield Case('repr', 'finite write_to',
+            {'length': length, 'style': 'plain'},
+            _write_to, fcf, 'plain' )
+        length *= 4
+
+def bench_resolve_quotients(lengths, *, processes=1, repeat=3, seed=0):
+    """
+    Yield (length, sequential time, tree time) for each length.
+    """
+    rng = random.Random(seed)
+    resolve = FiniteContinuedFraction.resolve_quotients
+    for length in lengths:
+        quotients = [rng.randint(1, 100) for i in range(length)]
+        sequential = best_time(resolve, quotients,
+            method='sequential', repeat=repeat )
+        tree = best_time(resolve, quotients,
+            method='tree', processes=processes, repeat=repeat )
+        yield length, sequential, tree
+
+GROUPS = ('construction', 'resolve', 'finite', 'repr')
+
+def iter_cases(groups=GROUPS, *, max_length=2**17, max_bits=2**16,
+    processes=1, seed=0
+):
+    if 'construction' in groups:
+        yield from construction_cases(max_bits=max_bits // 16, seed=seed)
+    if 'resolve' in groups:
+        yield from resolve_cases(max_length=max_length,
+            processes=processes, seed=seed )
+    if 'finite' in groups:
+        yield from finite_cases(max_bits=max_bits, seed=seed)
+    if 'repr' in groups:
+        yield from repr_cases(max_length=max_length, seed=seed)
+
+def format_params(params):
+    return ' '.join('{}={}'.format(key, value)
+        for key, value in params.items() )
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Benchmark pcf.py' )
+    parser.add_argument('groups', nargs='*', metavar='GROUP',
+        help='groups of cases to run: {} (default: all)'.format(
+            ', '.join(GROUPS) ))
+    parser.add_argument('-n', '--max-length', type=int,
+        default=2**17,
+        help='largest number of quotients' )
+    parser.add_argument('-b', '--max-bits', type=int,
+        default=2**16,
+        help='largest bit length of finite fractions'
+            ' (sqrtbase goes up to a sixteenth of it)' )
+    parser.add_argument('-p', '--processes', type=int,
+        default=1,
+        help='processes for the product tree' )
+    parser.add_argument('-r', '--repeat', type=int,
+        default=3,
+        help='take the best of this many runs' )
+    parser.add_argument('--seed', type=int,
+        default=0,
+        help='seed for random inputs' )
+    parser.add_argument('--no-memory', action='store_true',
+        help='skip the traced run measuring peak memory' )
+    parser.add_argument('--json', metavar='PATH',
+        help='also write results as JSON to PATH ("-" for stdout)' )
+    args = parser.parse_args()
+    for group in args.groups:
+        if group not in GROUPS:
+            parser.error('unknown group: {}'.format(group))
+
+    results = []
+    out = sys.stderr if args.json == '-' else sys.stdout
+    print('{:<13} {:<18} {:>12} {:>12}  {}'.format(
+        'group', 'case', 'time', 'peak memory', 'parameters' ), file=out)
+    for case in iter_cases(args.groups or GROUPS,
+        max_length=args.max_length, max_bits=args.max_bits,
+        processes=args.processes, seed=args.seed
+    ):
+        result = case.run(repeat=args.repeat, memory=not args.no_memory)
+        results.append(result)
+        print('{:<13} {:<18} {:>12.6f} {:>12}  {}'.format(
+            result['group'], result['name'], result['time'],
+            result.get('peak_memory', '-'),
+            format_params(result['params']) ), file=out, flush=True)
+
+    if args.json is not None:
+        report = {
+            'python': sys.version,
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'arguments': vars(args),
+            'results': results,
+            }
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        else:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=1)